@@ -0,0 +1,264 @@
+"""
+Zoom animations along a keyframe path.
+
+    path = ZoomPath([(0, (0, 0), 2), (10, (-0.5, 0.1), 1e-4)])
+    render_animation('z**3 - 1', path, PNGSequenceSink('frames'), width=1280, height=720, fps=30)
+
+Frames are not rendered one by one. Consecutive frames are grouped so
+that a single anchor image, rendered `oversample` times larger than a
+frame, covers all of them with at least one sample per frame pixel; each
+frame is then resampled from its anchor. With the default oversample=2
+and a slow zoom, one anchor serves dozens of frames. oversample=1 renders
+every distinct frame exactly.
+
+The anchor for the next group is rendered while a writer thread resamples,
+colors and writes the frames of the previous one. One engine (and its
+compiled function) and one root table are used for the whole animation, so
+basin colors stay stable from frame to frame.
+"""
+import os
+import queue
+import threading
+
+import numpy as np
+
+from coloring import colorize_basins, colorize_iterations
+from fractal_engine import NewtonFractalEngine, RootTable
+from image_io import PNGStreamWriter
+
+
+class ZoomPath:
+    """
+    Keyframes (time, (center_x, center_y), scale), scale being the half-width
+    of the view. Between keyframes the scale changes geometrically and the
+    center moves with it, so each segment is a zoom about one fixed point.
+    """
+    def __init__(self, keyframes):
+        keyframes = sorted(keyframes, key=lambda keyframe: keyframe[0])
+        if len(keyframes) < 1:
+            raise ValueError("a zoom path needs at least one keyframe")
+        self.keyframes = [(float(t), (np.longdouble(cx), np.longdouble(cy)), np.longdouble(scale))
+                          for t, (cx, cy), scale in keyframes]
+
+    @classmethod
+    def from_json(cls, data):
+        """From a list of {"time": t, "center": [x, y], "scale": s} dicts."""
+        return cls([(k['time'], tuple(k['center']), k['scale']) for k in data])
+
+    @property
+    def duration(self):
+        return self.keyframes[-1][0]
+
+    def view(self, t):
+        """(center_x, center_y, scale) at time t."""
+        keyframes = self.keyframes
+        if t <= keyframes[0][0]:
+            return keyframes[0][1] + (keyframes[0][2],)
+        for (t0, c0, s0), (t1, c1, s1) in zip(keyframes, keyframes[1:]):
+            if t <= t1:
+                u = np.longdouble((t - t0) / (t1 - t0)) if t1 > t0 else np.longdouble(1)
+                scale = s0 * (s1 / s0) ** u
+                # Fraction of the way along the segment, measured in scale change
+                w = (s0 - scale) / (s0 - s1) if s0 != s1 else u
+                return c0[0] + w * (c1[0] - c0[0]), c0[1] + w * (c1[1] - c0[1]), scale
+        return keyframes[-1][1] + (keyframes[-1][2],)
+
+    def frames(self, fps):
+        """View of every frame at fps frames per second."""
+        count = int(round(self.duration * fps)) + 1
+        return [self.view(index / fps) for index in range(count)]
+
+
+def plan_anchors(views, aspect, oversample=2):
+    """
+    Group consecutive frame views (center_x, center_y, half_width) so that
+    one view oversample times larger in pixels covers each group without
+    coarser sampling than any of its frames.
+    Returns a list of (anchor_view, [frame indices]).
+    """
+    groups = []
+    start = 0
+    while start < len(views):
+        end = start + 1
+        anchor = _bounding_view(views[start:end], aspect)
+        while end < len(views):
+            candidate = _bounding_view(views[start:end + 1], aspect)
+            smallest = min(view[2] for view in views[start:end + 1])
+            if candidate[2] > oversample * smallest * (1 + 1e-9):
+                break
+            anchor = candidate
+            end += 1
+        groups.append((anchor, list(range(start, end))))
+        start = end
+    return groups
+
+
+def _bounding_view(views, aspect):
+    """Smallest view with the frames' aspect ratio (height / width) containing all views."""
+    x0 = min(cx - s for cx, _, s in views)
+    x1 = max(cx + s for cx, _, s in views)
+    y0 = min(cy - s * aspect for _, cy, s in views)
+    y1 = max(cy + s * aspect for _, cy, s in views)
+    half_width = max((x1 - x0) / 2, (y1 - y0) / 2 / aspect)
+    return (x0 + x1) / 2, (y0 + y1) / 2, half_width
+
+
+def _sample_positions(frame_lo, frame_hi, size, anchor_lo, anchor_hi, anchor_size):
+    """Fractional anchor pixel index of each frame pixel center along one axis."""
+    world = frame_lo + (frame_hi - frame_lo) * np.arange(size, dtype=np.longdouble) / max(size - 1, 1)
+    position = (world - anchor_lo) / (anchor_hi - anchor_lo) * (anchor_size - 1)
+    return np.clip(position.astype(np.float64), 0, anchor_size - 1)
+
+
+def resample(iterations, labels, anchor_view, frame_view, width, height):
+    """
+    Frame (iterations, labels) from anchor buffers: bilinear for iteration
+    counts, nearest neighbour for root labels.
+    """
+    aspect = height / width
+    anchor_H, anchor_W = iterations.shape
+    (acx, acy, a_s), (fcx, fcy, f_s) = anchor_view, frame_view
+    px = _sample_positions(fcx - f_s, fcx + f_s, width, acx - a_s, acx + a_s, anchor_W)
+    py = _sample_positions(fcy - f_s * aspect, fcy + f_s * aspect, height,
+                           acy - a_s * aspect, acy + a_s * aspect, anchor_H)
+
+    x0 = np.minimum(px.astype(np.intp), anchor_W - 2) if anchor_W > 1 else np.zeros(width, np.intp)
+    y0 = np.minimum(py.astype(np.intp), anchor_H - 2) if anchor_H > 1 else np.zeros(height, np.intp)
+    x1 = np.minimum(x0 + 1, anchor_W - 1)
+    y1 = np.minimum(y0 + 1, anchor_H - 1)
+    fx = (px - x0).astype(np.float32)[None, :]
+    fy = (py - y0).astype(np.float32)[:, None]
+
+    counts = iterations.astype(np.float32, copy=False)
+    top = counts[y0[:, None], x0] * (1 - fx) + counts[y0[:, None], x1] * fx
+    bottom = counts[y1[:, None], x0] * (1 - fx) + counts[y1[:, None], x1] * fx
+    frame_iterations = top * (1 - fy) + bottom * fy
+    if iterations.dtype.kind != 'f':
+        frame_iterations = np.rint(frame_iterations)
+    frame_iterations = frame_iterations.astype(iterations.dtype)
+
+    frame_labels = None
+    if labels is not None:
+        frame_labels = labels[np.rint(py).astype(np.intp)[:, None], np.rint(px).astype(np.intp)]
+    return frame_iterations, frame_labels
+
+
+class PNGSequenceSink:
+    """Writes frame N to directory/pattern.format(N)."""
+    def __init__(self, directory, pattern='frame_{:05d}.png'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pattern = pattern
+
+    def write(self, index, image):
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else 3
+        with PNGStreamWriter(os.path.join(self.directory, self.pattern.format(index)),
+                             width, height, channels) as writer:
+            writer.write_rows(image)
+
+    def close(self):
+        pass
+
+
+class RawVideoSink:
+    """
+    Writes frames as raw RGB24 to a binary file object, e.g. the stdin of
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r FPS -i - out.mp4
+    """
+    def __init__(self, fh):
+        self.fh = fh
+
+    def write(self, index, image):
+        if image.ndim == 2:
+            image = np.repeat(image[..., None], 3, axis=2)
+        self.fh.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+
+    def close(self):
+        self.fh.flush()
+
+
+def render_animation(func_str, path, sink, width=1280, height=720, fps=30, oversample=2,
+                     basins=False, tile_size='auto', progress_callback=None, **engine_options):
+    """
+    Render the frames of path to sink. engine_options are passed to
+    NewtonFractalEngine (max_iter, tol, backend, kernel, precision, ...).
+    progress_callback receives the percentage of frames written.
+    Returns the number of frames written.
+    """
+    aspect = height / width
+    views = path.frames(fps)
+    groups = plan_anchors(views, aspect, oversample)
+    engine = NewtonFractalEngine(func_str, **engine_options)
+    root_table = RootTable(engine.root_tol) if basins else None
+
+    # Two anchor buffer sets, allocated once: one being rendered, one being
+    # resampled by the writer
+    free_buffers = queue.Queue()
+    for _ in range(2):
+        free_buffers.put((np.zeros((height * oversample, width * oversample), dtype=engine.iteration_dtype),
+                          np.zeros((height * oversample, width * oversample), dtype=np.uint16) if basins else None))
+    work = queue.Queue(maxsize=1)
+    errors = []
+
+    def write_frames():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            buffers, anchor_view, indices, anchor_size = item
+            try:
+                if errors:
+                    continue
+                iterations = buffers[0][:anchor_size[0], :anchor_size[1]]
+                labels = buffers[1][:anchor_size[0], :anchor_size[1]] if basins else None
+                for index in indices:
+                    if anchor_size == (height, width):
+                        frame_iterations, frame_labels = iterations, labels
+                    else:
+                        frame_iterations, frame_labels = resample(iterations, labels, anchor_view,
+                                                                  views[index], width, height)
+                    if basins:
+                        image = colorize_basins(frame_labels, frame_iterations, engine.max_iter,
+                                                root_table.roots.size)
+                    else:
+                        image = colorize_iterations(frame_iterations, engine.max_iter)
+                    sink.write(index, image)
+                    if progress_callback:
+                        progress_callback(int(100 * (index + 1) / len(views)))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                free_buffers.put(buffers)
+
+    writer = threading.Thread(target=write_frames, daemon=True)
+    writer.start()
+    try:
+        for anchor_view, indices in groups:
+            if errors:
+                break
+            # A group of identical frames is rendered at frame size
+            single = all(views[index] == views[indices[0]] for index in indices)
+            scale = 1 if single else oversample
+            anchor_H, anchor_W = height * scale, width * scale
+            engine.width, engine.height = anchor_W, anchor_H
+            cx, cy, half_width = views[indices[0]] if single else anchor_view
+            engine.xlim = (cx - half_width, cx + half_width)
+            engine.ylim = (cy - half_width * aspect, cy + half_width * aspect)
+
+            buffers = free_buffers.get()
+            iterations = buffers[0][:anchor_H, :anchor_W]
+            labels = buffers[1][:anchor_H, :anchor_W] if basins else None
+            for y_start, x_start, iter_tile, labels_tile in engine.iter_tiles(tile_size, None, root_table):
+                y_end, x_end = y_start + iter_tile.shape[0], x_start + iter_tile.shape[1]
+                iterations[y_start:y_end, x_start:x_end] = iter_tile
+                if basins:
+                    labels[y_start:y_end, x_start:x_end] = labels_tile
+            work.put((buffers, (cx, cy, half_width), indices, (anchor_H, anchor_W)))
+    finally:
+        work.put(None)
+        writer.join()
+        sink.close()
+    if errors:
+        raise errors[0]
+    return len(views)
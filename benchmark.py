@@ -0,0 +1,205 @@
+"""
+Benchmarks for NewtonFractalEngine.compute.
+
+    python -m benchmark run --save baseline.json
+    python -m benchmark run --compare baseline.json --threshold 0.1
+
+Every combination of function, resolution, tile size, backend and kernel
+is rendered --repeat times and the fastest run is reported as Mpixels/s
+and Newton iterations/s. Peak host memory is measured in a separate,
+untimed run because tracemalloc slows allocation down.
+A saved baseline can be compared against a later run; cases that got
+slower by more than --threshold are reported and the exit status is 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from fractal_engine import KERNELS, NewtonFractalEngine, _cupy_available
+
+# The functions shown in the README
+FUNCTIONS = (
+    'z**3 - 1',
+    '0.1*exp(z) - sin(z)',
+    'exp(sin(z**3) + cos(z**3)) + 3',
+    'tan(z**3) + cos(z**3) + sin(z**3)',
+)
+SIZES = (500, 1000)
+TILE_SIZES = (250, 1000, 'auto')
+
+
+def available_backends():
+    return ('numpy', 'cupy') if _cupy_available() else ('numpy',)
+
+
+def available_kernels(backend):
+    """The fused kernel needs Numba and the NumPy backend."""
+    if backend != 'numpy':
+        return ('vectorized',)
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        return ('vectorized',)
+    return KERNELS
+
+
+def case_key(function, size, tile_size, backend, kernel):
+    return f"{function} | {size}x{size} | tile {tile_size} | {backend} | {kernel}"
+
+
+def machine_info():
+    info = {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+    }
+    if _cupy_available():
+        import cupy
+        info['cupy'] = cupy.__version__
+        info['device'] = cupy.cuda.runtime.getDeviceProperties(0)['name'].decode()
+    return info
+
+
+def _synchronize(backend):
+    if backend == 'cupy':
+        import cupy
+        cupy.cuda.Stream.null.synchronize()
+
+
+def run_case(function, size, tile_size, backend, kernel, repeat=3, max_iter=50):
+    """Benchmark one configuration and return its result dict."""
+    engine = NewtonFractalEngine(function, width=size, height=size, max_iter=max_iter,
+                                 backend=backend, kernel=kernel)
+
+    # Warm up JIT compilation and the CuPy memory pool outside the timed runs
+    engine.compute(tile_size=tile_size)
+    _synchronize(backend)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine.compute(tile_size=tile_size)
+        _synchronize(backend)
+        timings.append(time.perf_counter() - start)
+    stats = engine.last_stats
+
+    tracemalloc.start()
+    engine.compute(tile_size=tile_size)
+    _, peak_host_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    result = {
+        'seconds': best,
+        'seconds_all': timings,
+        'mpixels_per_second': size * size / best / 1e6,
+        'iterations_per_second': stats.newton_steps / best,
+        'newton_steps': stats.newton_steps,
+        'compile_seconds': engine.compile_seconds,
+        'peak_host_bytes': peak_host_bytes,
+    }
+    if backend == 'cupy':
+        import cupy
+        result['device_pool_bytes'] = cupy.get_default_memory_pool().total_bytes()
+    return result
+
+
+def run_benchmarks(functions=FUNCTIONS, sizes=SIZES, tile_sizes=TILE_SIZES,
+                   backends=None, kernels=KERNELS, repeat=3, max_iter=50):
+    """Run the benchmark matrix; returns {'machine': ..., 'results': {case: result}}."""
+    backends = available_backends() if backends is None else backends
+    results = {}
+    for backend in backends:
+        usable = [kernel for kernel in kernels if kernel in available_kernels(backend)]
+        for function, size, tile_size, kernel in itertools.product(functions, sizes, tile_sizes, usable):
+            key = case_key(function, size, tile_size, backend, kernel)
+            result = run_case(function, size, tile_size, backend, kernel, repeat, max_iter)
+            results[key] = result
+            print(f"{key}: {result['mpixels_per_second']:8.2f} Mpix/s  "
+                  f"{result['iterations_per_second'] / 1e6:8.2f} Miter/s  "
+                  f"{result['peak_host_bytes'] / 2**20:7.1f} MiB peak", flush=True)
+    return {'machine': machine_info(), 'results': results}
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compare Mpixels/s of the cases present in both runs.
+    Returns a list of (case, ratio) for cases slower than 1 - threshold.
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None:
+            continue
+        ratio = result['mpixels_per_second'] / reference['mpixels_per_second']
+        flag = 'SLOWER' if ratio < 1 - threshold else 'faster' if ratio > 1 + threshold else ''
+        print(f"{key}: {ratio:6.2f}x {flag}")
+        if ratio < 1 - threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def _tile_size(value):
+    return value if value == 'auto' else int(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmark', description="Benchmark the Newton fractal engine")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the benchmark matrix")
+    run.add_argument('--functions', nargs='+', default=FUNCTIONS)
+    run.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    run.add_argument('--tile-sizes', type=_tile_size, nargs='+', default=TILE_SIZES)
+    run.add_argument('--backends', nargs='+', choices=('numpy', 'cupy'))
+    run.add_argument('--kernels', nargs='+', choices=KERNELS, default=KERNELS)
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--max-iter', type=int, default=50)
+    run.add_argument('--save', metavar='FILE', help="write the results as JSON")
+    run.add_argument('--compare', metavar='FILE', help="baseline JSON to compare against")
+    run.add_argument('--threshold', type=float, default=0.1,
+                     help="relative slowdown reported as a regression (default 0.1)")
+
+    diff = commands.add_parser('compare', help="compare two saved runs")
+    diff.add_argument('current')
+    diff.add_argument('baseline')
+    diff.add_argument('--threshold', type=float, default=0.1)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.current) as fh:
+            current = json.load(fh)
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        return 1 if compare(current, baseline, args.threshold) else 0
+
+    current = run_benchmarks(args.functions, args.sizes, args.tile_sizes, args.backends,
+                             args.kernels, args.repeat, args.max_iter)
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(current, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than baseline", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Turning engine output (iteration counts, root labels) into 8-bit images.
+Done lazily at display/export time so the engine only ships compact buffers.
+"""
+import colorsys
+
+import numpy as np
+
+
+def iteration_lut(max_iter):
+    """
+    Lookup table mapping an iteration count to a gray level in [0, 255].
+    """
+    return (np.arange(max_iter + 1, dtype=np.uint32) * 255 // max(max_iter, 1)).astype(np.uint8)
+
+
+def colorize_iterations(iterations, max_iter):
+    """
+    Grayscale (H, W) uint8 image: brighter means more iterations.
+    Fractional (smooth) counts are shaded continuously.
+    """
+    if iterations.dtype.kind == 'f':
+        return (np.clip(iterations, 0, max_iter) * (255 / max(max_iter, 1))).astype(np.uint8)
+    return iteration_lut(max_iter)[iterations]
+
+
+def downsample(iterations, width, height):
+    """
+    Shrink iteration counts for display in a width x height area by
+    averaging square blocks, keeping at least that many pixels so the
+    final scaling step is a mild reduction. Returned as is if already small.
+    """
+    H, W = iterations.shape
+    factor = max(1, min(H // max(height, 1), W // max(width, 1)))
+    if factor == 1:
+        return iterations
+    row_starts = np.arange(0, H, factor)
+    col_starts = np.arange(0, W, factor)
+    smooth = iterations.dtype.kind == 'f'
+    sums = np.add.reduceat(np.add.reduceat(iterations, row_starts, axis=0,
+                                           dtype=np.float64 if smooth else np.uint32),
+                           col_starts, axis=1)
+    # Edge blocks may be partial
+    counts = np.outer(np.diff(np.append(row_starts, H)), np.diff(np.append(col_starts, W)))
+    if smooth:
+        return (sums / counts).astype(iterations.dtype)
+    return ((sums + counts // 2) // counts).astype(iterations.dtype)
+
+
+def basin_palette(n_roots):
+    """
+    (n_roots + 1, 3) uint8 palette; entry 0 (no convergence) is black and
+    roots get well-separated hues.
+    """
+    palette = np.zeros((n_roots + 1, 3), dtype=np.uint8)
+    for k in range(n_roots):
+        hue = (k * 0.618033988749895) % 1.0
+        palette[k + 1] = [round(255 * c) for c in colorsys.hsv_to_rgb(hue, 0.75, 1.0)]
+    return palette
+
+
+def colorize_basins(labels, iterations, max_iter, n_roots):
+    """
+    RGB (H, W, 3) uint8 image: hue from the root label, darkened by the
+    number of iterations it took to get there.
+    """
+    if iterations.dtype.kind == 'f':
+        shade = (255 - np.clip(iterations, 0, max_iter) * (180 / max(max_iter, 1))).astype(np.uint16)
+    else:
+        shade = (255 - (np.arange(max_iter + 1, dtype=np.uint32) * 180 // max(max_iter, 1)))[iterations]
+    rgb = basin_palette(n_roots)[labels].astype(np.uint16)
+    rgb *= shade.astype(np.uint16)[..., None]
+    rgb //= 255
+    return rgb.astype(np.uint8)
@@ -0,0 +1,315 @@
+"""
+Distributed rendering: a Coordinator hands tiles to worker processes,
+local or on other machines, over multiprocessing.connection sockets.
+
+    # on each worker machine
+    python -m newton_fractal worker coordinator-host:6000 --authkey secret --processes 8
+    # on the coordinating machine
+    python -m newton_fractal render "z**3 - 1" -o poster.png --width 20000 --height 20000 \\
+        --listen 0.0.0.0:6000 --authkey secret
+
+Workers pull one tile at a time, so faster machines get more tiles. Tiles
+of a worker that fails or disconnects are retried on others, and once no
+tiles are left, idle workers duplicate the oldest outstanding tile (work
+stealing), so a slow worker or a heavy tile cannot hold up the end of the
+render; the first result to arrive wins.
+
+Messages are pickled, so anyone who knows the authkey can run code on
+the coordinator and workers: only accept workers on a trusted network and
+keep the key secret. Without one, a Coordinator makes up a random key.
+"""
+import itertools
+import multiprocessing
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from fractal_engine import NewtonFractalEngine, RootTable, available_precisions, resolve_backend, to_numpy
+from render_stats import RenderStats
+from tile_cache import compact_labels
+
+
+class TileFailed(Exception):
+    """A tile failed on max_attempts workers."""
+
+
+class NoWorkers(Exception):
+    """Every local worker process exited and no worker is connected."""
+
+
+def parse_address(text, default_host='localhost'):
+    """'host:port' (or ':port') as a (host, port) tuple."""
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port)
+
+
+def engine_spec(engine, labels=False):
+    """Everything a worker needs to render the engine's tiles identically."""
+    return {
+        'func_str': engine.func_str,
+        'width': engine.width,
+        'height': engine.height,
+        'xlim': engine.xlim,
+        'ylim': engine.ylim,
+        'max_iter': engine.max_iter,
+        'tol': engine.tol,
+        'root_tol': engine.root_tol,
+        'kernel': engine.kernel,
+        'precision': engine.resolve_precision(),
+        'adaptive': engine.adaptive,
+        'adaptive_min_size': engine.adaptive_min_size,
+        'adaptive_tolerance': engine.adaptive_tolerance,
+        'smooth': engine.smooth,
+        'supersample': engine.supersample,
+        'labels': labels,
+    }
+
+
+class _Job:
+    """Tile bookkeeping for one render."""
+    def __init__(self, job_id, spec, tiles):
+        self.id = job_id
+        self.spec = spec
+        self.pending = deque(tiles)
+        # tile -> number of workers currently rendering it
+        self.running = Counter()
+        # tile -> time it was first handed out, for picking tiles to steal
+        self.issued = {}
+        self.failures = Counter()
+        self.done = set()
+        self.results = deque()
+        self.error = None
+
+    def next_tile(self):
+        if self.pending:
+            tile = self.pending.popleft()
+        else:
+            # Work stealing: duplicate the longest-running tile nobody else is helping with
+            candidates = [tile for tile, count in self.running.items() if count == 1 and tile not in self.done]
+            if not candidates:
+                return None
+            tile = min(candidates, key=self.issued.__getitem__)
+        self.running[tile] += 1
+        self.issued.setdefault(tile, time.perf_counter())
+        return tile
+
+    def complete(self, tile, result):
+        self.running[tile] -= 1
+        if tile not in self.done:
+            self.done.add(tile)
+            self.results.append((tile,) + result)
+
+    def fail(self, tile, reason, max_attempts):
+        self.running[tile] -= 1
+        if tile in self.done:
+            return
+        self.failures[tile] += 1
+        if self.failures[tile] >= max_attempts:
+            self.error = TileFailed(f"tile {tile} failed {self.failures[tile]} times, last: {reason}")
+        elif self.running[tile] == 0:
+            self.pending.appendleft(tile)
+
+
+class Coordinator:
+    """
+    Accepts worker connections on address and distributes the tiles of
+    engines constructed with coordinator=self. Workers stay connected
+    between renders; several renders (e.g. batch jobs) can run at once
+    and are served in the order they started. authkey defaults to a random
+    key; workers on other machines must be given self.authkey.
+    """
+    def __init__(self, address=('localhost', 0), authkey=None, max_attempts=3):
+        if authkey is None:
+            authkey = secrets.token_hex(16).encode()
+        self.authkey = authkey
+        self.max_attempts = max_attempts
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self.workers = 0
+        self._jobs = OrderedDict()
+        self._job_ids = itertools.count()
+        self._closed = False
+        self._processes = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def start_local_workers(self, count, backend='auto'):
+        """Start count worker processes on this machine."""
+        context = multiprocessing.get_context('spawn')
+        for _ in range(count):
+            process = context.Process(target=run_worker, args=(self.address, self.authkey, backend), daemon=True)
+            process.start()
+            self._processes.append(process)
+
+    def close(self):
+        """Stop idle workers and local worker processes, and stop listening."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._listener.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, engine, tiles, labels=False):
+        """
+        Render tiles of engine on the workers. Generator yielding
+        (tile, iterations, labels, roots, histogram, seconds) in completion
+        order; labels index into roots (1-based) and are None unless
+        labels=True. Raises TileFailed, NoWorkers when the local workers
+        died and no others are connected, or RenderCancelled when the
+        engine is cancelled.
+        """
+        with self._cond:
+            job = _Job(next(self._job_ids), engine_spec(engine, labels), tiles)
+            self._jobs[job.id] = job
+            self._cond.notify_all()
+        try:
+            remaining = len(tiles)
+            while remaining:
+                with self._cond:
+                    while not job.results and job.error is None and not engine.cancel_event.is_set():
+                        self._check_workers()
+                        self._cond.wait(timeout=0.1)
+                    if job.error is not None:
+                        raise job.error
+                    engine._check_cancelled()
+                    results = list(job.results)
+                    job.results.clear()
+                for result in results:
+                    remaining -= 1
+                    yield result
+        finally:
+            with self._cond:
+                del self._jobs[job.id]
+                self._cond.notify_all()
+
+    def _check_workers(self):
+        """Raise NoWorkers if nothing is left to render tiles; call with self._cond held."""
+        if self.workers or not self._processes or any(p.is_alive() for p in self._processes):
+            return
+        codes = ', '.join(str(p.exitcode) for p in self._processes)
+        raise NoWorkers(f"all {len(self._processes)} local workers exited (exit codes {codes}) "
+                        f"and no worker is connected")
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue
+            except OSError:
+                return  # Listener closed
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _next_assignment(self):
+        for job in self._jobs.values():
+            if job.error is None:
+                tile = job.next_tile()
+                if tile is not None:
+                    return job, tile
+        return None
+
+    def _serve(self, conn):
+        """Feed one worker connection until it drops or the coordinator closes."""
+        job = tile = None
+        with self._cond:
+            self.workers += 1
+        try:
+            conn.recv()  # ('hello', name)
+            while True:
+                with self._cond:
+                    assignment = self._next_assignment()
+                    while assignment is None and not self._closed:
+                        self._cond.wait()
+                        assignment = self._next_assignment()
+                if assignment is None:
+                    conn.send(('stop',))
+                    return
+                job, tile = assignment
+                conn.send(('tile', job.id, job.spec, tile))
+                reply = conn.recv()
+                with self._cond:
+                    if reply[0] == 'result':
+                        job.complete(tile, reply[1:])
+                    else:
+                        job.fail(tile, reply[1], self.max_attempts)
+                    self._cond.notify_all()
+                job = tile = None
+        except (EOFError, OSError) as exc:
+            with self._cond:
+                if job is not None:
+                    job.fail(tile, f"worker lost ({exc or type(exc).__name__})", self.max_attempts)
+                self._cond.notify_all()
+        finally:
+            with self._cond:
+                self.workers -= 1
+            conn.close()
+
+
+def _worker_engine(spec, backend):
+    backend, _ = resolve_backend(backend)
+    if spec['precision'] not in available_precisions(backend) or spec['kernel'] == 'fused':
+        backend = 'numpy'
+    engine = NewtonFractalEngine(spec['func_str'], width=spec['width'], height=spec['height'],
+                                 max_iter=spec['max_iter'], tol=spec['tol'], backend=backend,
+                                 workers=1, kernel=spec['kernel'], root_tol=spec['root_tol'],
+                                 adaptive=spec['adaptive'], adaptive_min_size=spec['adaptive_min_size'],
+                                 adaptive_tolerance=spec['adaptive_tolerance'], precision=spec['precision'],
+                                 smooth=spec['smooth'], supersample=spec['supersample'])
+    engine.xlim = spec['xlim']
+    engine.ylim = spec['ylim']
+    return engine
+
+
+def run_worker(address, authkey, backend='auto'):
+    """
+    Connect to a Coordinator and render the tiles it sends until it says
+    stop or goes away.
+    """
+    job_id = engine = None
+    with Client(tuple(address), authkey=authkey) as conn:
+        conn.send(('hello', f"{socket.gethostname()}:{os.getpid()}"))
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message[0] == 'stop':
+                return
+            _, tile_job_id, spec, tile = message
+            try:
+                if tile_job_id != job_id:
+                    engine = _worker_engine(spec, backend)
+                    x_coords, y_coords = engine._axes()
+                    job_id = tile_job_id
+                reply = ('result',) + _render_tile(engine, x_coords, y_coords, tile, spec['labels'])
+            except Exception as exc:
+                job_id = None
+                reply = ('error', f"{type(exc).__name__}: {exc}")
+            conn.send(reply)
+
+
+def _render_tile(engine, x_coords, y_coords, tile, labels):
+    y_start, y_end, x_start, x_end = tile
+    root_table = RootTable(engine.root_tol) if labels else None
+    engine.last_stats = RenderStats(engine, 'tiles')
+    start = time.perf_counter()
+    iterations, labels_tile = engine._compute_tile(x_coords[x_start:x_end], y_coords[y_start:y_end], root_table)
+    iterations = to_numpy(iterations)
+    roots = None
+    if labels_tile is not None:
+        labels_tile, roots = compact_labels(to_numpy(labels_tile), root_table.roots)
+    seconds = time.perf_counter() - start
+    return iterations, labels_tile, roots, engine.last_stats.iteration_histogram, seconds
@@ -1,10 +1,210 @@
-# fractal_engine.py
-import sympy as sp
-import cupy as cp
+import itertools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
 import numpy as np
 
+from function_cache import default_function_cache, near_root_bound, normalize_expression
+from render_stats import RenderStats
+from tile_cache import compact_labels
+from tile_planner import plan_tiles
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+BACKENDS = ('auto', 'numpy', 'cupy')
+KERNELS = ('vectorized', 'fused')
+PRECISIONS = ('auto', 'complex64', 'complex128', 'extended')
+
+# Real component dtype of each precision. 'extended' is NumPy's long double
+# (80-bit x87 on most x86 platforms), so it is only offered on the NumPy backend.
+REAL_DTYPES = {
+    'complex64': np.float32,
+    'complex128': np.float64,
+    'extended': np.longdouble,
+}
+
+
+def resolve_backend(backend='auto'):
+    """
+    Return (name, array_module) for the requested backend.
+    'auto' picks CuPy when a CUDA device is usable, NumPy otherwise.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+    if backend == 'auto':
+        backend = 'cupy' if _cupy_available() else 'numpy'
+
+    if backend == 'cupy':
+        if cp is None:
+            raise ImportError("The 'cupy' backend requires CuPy to be installed")
+        return 'cupy', cp
+    return 'numpy', np
+
+
+def _cupy_available():
+    if cp is None:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+def available_precisions(backend):
+    """
+    Concrete precisions usable on a backend, cheapest first.
+    """
+    precisions = ['complex64', 'complex128']
+    if backend == 'numpy' and np.finfo(np.longdouble).eps < np.finfo(np.float64).eps:
+        precisions.append('extended')
+    return precisions
+
+
+def choose_precision(xlim, ylim, width, height, tol, backend='numpy'):
+    """
+    Cheapest precision that can resolve the view: neighbouring pixels must
+    differ by at least 256 ulps, and ulps near the view must be well below
+    the convergence tolerance. complex64 is never chosen, only used when
+    asked for: near a repeated root float32 Newton stalls about sqrt(eps)
+    (3e-4) away, so pixels fail to converge at any usual tol. Returns None
+    if no available precision is sufficient (the view is zoomed in too deep).
+    """
+    spacing = min(abs(xlim[1] - xlim[0]) / max(width - 1, 1),
+                  abs(ylim[1] - ylim[0]) / max(height - 1, 1))
+    scale = max(abs(xlim[0]), abs(xlim[1]), abs(ylim[0]), abs(ylim[1]), 1.0)
+    for precision in available_precisions(backend):
+        if precision == 'complex64':
+            continue
+        eps = np.finfo(REAL_DTYPES[precision]).eps
+        if spacing > 256 * eps * scale and 8 * eps * scale <= tol:
+            return precision
+    return None
+
+
+def to_numpy(array):
+    """
+    Copy a backend array to host memory (no-op for NumPy arrays).
+    """
+    if cp is not None and isinstance(array, cp.ndarray):
+        return cp.asnumpy(array)
+    return np.asarray(array)
+
+
+class RenderCancelled(Exception):
+    """
+    Raised from a render when the engine's cancel_event is set.
+    """
+
+
+class RootTable:
+    """
+    Roots discovered while rendering, de-duplicated on the fly: final
+    iterates within tol of a known root get that root's label, others
+    start a new root. Shared between tiles, so access is locked.
+    """
+    def __init__(self, tol):
+        self.tol = tol
+        self.roots = np.empty(0, dtype=np.complex128)
+        self._lock = threading.Lock()
+
+    def label(self, xp, Z, converged):
+        """
+        Return uint16 labels for Z: 1-based root index, or 0 where the point
+        did not converge.
+        """
+        labels = xp.zeros(Z.shape, dtype=xp.uint16)
+        converged = converged & xp.isfinite(Z)
+        Z_conv = Z[converged]
+        if Z_conv.size == 0:
+            return labels
+
+        # Snap to a tol-sized grid so the (few) distinct candidates are
+        # matched on the host instead of every pixel
+        keys = xp.round(Z_conv.real / self.tol) + 1j * xp.round(Z_conv.imag / self.tol)
+        candidates, inverse = xp.unique(keys, return_inverse=True)
+        candidates = to_numpy(candidates) * self.tol
+
+        with self._lock:
+            candidate_labels = np.array([self._match(c) for c in candidates], dtype=np.uint16)
+
+        labels[converged] = xp.asarray(candidate_labels)[inverse.ravel()]
+        return labels
+
+    def import_labels(self, labels, roots):
+        """
+        Translate labels that index into another root array (1-based, as
+        stored by TileCache) into labels of this table.
+        """
+        return self.match_roots(roots)[labels]
+
+    def match_roots(self, roots):
+        """
+        Lookup table from 1-based indices into roots to labels of this
+        table, adding roots it does not know yet; index 0 maps to 0.
+        """
+        with self._lock:
+            return np.array([0] + [self._match(r) for r in roots], dtype=np.uint16)
+
+    def _match(self, value):
+        if self.roots.size:
+            distances = np.abs(self.roots - value)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.tol:
+                return nearest + 1
+        if self.roots.size >= np.iinfo(np.uint16).max:
+            return 0 # Out of labels, treat as not converged
+        self.roots = np.append(self.roots, value)
+        return self.roots.size
+
+    def sorted_roots(self):
+        return self.roots[np.lexsort((self.roots.imag, self.roots.real))]
+
+    def sorted_remap(self):
+        """
+        Lookup table from discovery-order labels to labels of sorted_roots().
+        """
+        order = np.lexsort((self.roots.imag, self.roots.real))
+        remap = np.zeros(self.roots.size + 1, dtype=np.uint16)
+        remap[order + 1] = np.arange(1, self.roots.size + 1, dtype=np.uint16)
+        return remap
+
+    def finalize(self, labels):
+        """
+        Relabel so roots are sorted by (real, imag), making the output
+        independent of tile completion order. Returns (labels, roots) with
+        labels narrowed to uint8 when there are fewer than 256 roots.
+        """
+        dtype = np.uint8 if self.roots.size < 256 else np.uint16
+        return self.sorted_remap()[labels].astype(dtype), self.sorted_roots()
+
+
+def _jitter_offsets(count):
+    """
+    count sample offsets within a pixel (in pixels, centered on 0), one
+    jittered point per cell of a stratified grid. Fixed for a given
+    count, so supersampled renders are reproducible tile by tile.
+    """
+    side = math.ceil(math.sqrt(count))
+    rng = np.random.default_rng(count)
+    cells = rng.permutation(side * side)[:count]
+    offset_x = ((cells % side) + rng.random(count)) / side - 0.5
+    offset_y = ((cells // side) + rng.random(count)) / side - 0.5
+    return offset_x, offset_y
+
+
 class NewtonFractalEngine:
-    def __init__(self, func_str, width=1000, height=1000, max_iter=50, tol=1e-6):
+    def __init__(self, func_str, width=1000, height=1000, max_iter=50, tol=1e-6, backend='auto',
+                 workers=None, kernel='vectorized', function_cache=None,
+                 root_tol=1e-3, cancel_event=None, tile_cache=None,
+                 adaptive=False, adaptive_min_size=8, adaptive_tolerance=1,
+                 precision='auto', coordinator=None, smooth=False, supersample=0):
         self.func_str = func_str
         self.width = width
         self.height = height
@@ -12,76 +212,793 @@ class NewtonFractalEngine:
         self.tol = tol
         self.xlim = (-2, 2)
         self.ylim = (-2, 2)
+        # Final iterates closer than this are treated as the same root
+        self.root_tol = root_tol
+        # Checked between tiles and Newton steps; set it (or call cancel())
+        # from any thread to abort a running render with RenderCancelled
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        # Optional TileCache shared between renders (e.g. across zooms in the GUI)
+        self.tile_cache = tile_cache
+        # Optional distributed.Coordinator; tiles are then rendered by its
+        # worker processes instead of local threads
+        self.coordinator = coordinator
+
+        # --- Adaptive subdivision ---
+        # Rectangles whose border pixels all reach the same root within
+        # adaptive_tolerance iterations of each other are filled without
+        # iterating their interior (Mariani-Silver); others are split in four
+        # until they are adaptive_min_size pixels across.
+        self.adaptive = adaptive
+        self.adaptive_min_size = max(3, adaptive_min_size)
+        self.adaptive_tolerance = adaptive_tolerance
+
+        # --- Smooth counts ---
+        # Fractional iteration counts (float32), interpolated from how far the
+        # last step went below tol, so shading has no bands. No extra steps.
+        self.smooth = smooth
+
+        # --- Supersampling ---
+        # Pixels on basin boundaries (a 4-neighbour with another root, or a
+        # count more than one step away) get this many extra jittered samples,
+        # averaged into float32 counts; the rest of the tile keeps one sample.
+        # Only counts are averaged: labels keep the pixel center's root.
+        self.supersample = max(0, int(supersample))
+
+        # --- Array backend ---
+        self.backend, self.xp = resolve_backend(backend)
+
+        # --- Iteration kernel ---
+        # 'vectorized' evaluates whole arrays per Newton step; 'fused' compiles
+        # a per-pixel loop with Numba (CPU only).
+        if kernel not in KERNELS:
+            raise ValueError(f"Unknown kernel {kernel!r}, expected one of {KERNELS}")
+        if kernel == 'fused' and self.backend != 'numpy':
+            raise ValueError("The 'fused' kernel is only available on the NumPy backend")
+        self.kernel = kernel
+
+        # --- Precision ---
+        # 'auto' re-evaluates per render, so shallow views stay cheap and deep
+        # zooms switch to complex128 or extended precision as needed.
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+        if precision != 'auto' and precision not in available_precisions(self.backend):
+            raise ValueError(f"Precision {precision!r} is not available on the {self.backend} backend")
+        self.precision = precision
+
+        # --- Tile scheduling ---
+        # NumPy releases the GIL inside most ufuncs, so threads scale across
+        # cores. CuPy work is serialized on one device stream anyway.
+        if workers is None:
+            workers = (os.cpu_count() or 1) if self.backend == 'numpy' else 1
+        self.workers = max(1, int(workers))
 
         # --- SymPy parsing ---
-        z = sp.symbols('z')
-        self.f_sym = sp.sympify(func_str)
-        self.df_sym = sp.diff(self.f_sym, z)
-        self.f_num = sp.lambdify(z, self.f_sym, 'cupy')
-        self.df_num = sp.lambdify(z, self.df_sym, 'cupy')
+        # Parsed and compiled functions are shared process-wide, so zooming or
+        # recomputing the same f(z) skips all symbolic work.
+        if function_cache is None:
+            function_cache = default_function_cache
+        compile_start = time.perf_counter()
+        compiled = function_cache.get(func_str, self.backend)
+        self.f_sym = compiled.f_sym
+        self.df_sym = compiled.df_sym
+        # f and f' are evaluated together so shared subexpressions are computed once
+        self.fdf_num = compiled.fdf_num
+
+        # --- Polynomial fast path ---
+        # For polynomials (already evaluated in Horner form) the roots are
+        # precomputed: points stop once within tol of one, and basins are
+        # labelled by nearest root instead of clustering final iterates.
+        self.coefficients = compiled.coefficients
+        self.roots = compiled.roots
+        self._near_root_bounds = {}
+        if self.kernel == 'fused':
+            self._fused_kernel = compiled.fused_kernel()
+        self.compile_seconds = time.perf_counter() - compile_start
+
+        # RenderStats of the current or most recent render
+        self.last_stats = None
+        # TilePlan of the most recent tile_size='auto' render
+        self.last_plan = None
 
-    def compute(self, tile_size=1000, progress_callback=None):
+    def compute(self, tile_size='auto', progress_callback=None, return_labels=False):
         """
-        Compute Newton iteration on GPU using tiling.
+        Compute Newton iteration on the selected backend using tiling.
+        Tiles are dispatched to a thread pool and written straight into
+        the shared output buffer. tile_size='auto' picks the tile size from
+        free memory, core count and measured cost (see plan_tiles).
+
+        Returns a (height, width) array of iteration counts in [0, max_iter],
+        uint8 when max_iter fits in a byte and uint16 otherwise, or float32
+        fractional counts with smooth=True or supersample. Coloring is left
+        to the caller (see coloring.py).
+
+        With return_labels=True, returns (image, labels, roots): labels holds
+        for each pixel the 1-based index into roots of the root it converged
+        to (0 if it did not converge), roots are sorted by real then imaginary part.
         """
         H, W = self.height, self.width
-        full_image = cp.zeros((H, W, 3), dtype=cp.float32)
+        full_image = np.zeros((H, W), dtype=self.iteration_dtype)
+        if return_labels:
+            root_table = RootTable(self.root_tol)
+            full_labels = np.zeros((H, W), dtype=np.uint16)
+        else:
+            root_table = None
 
+        tiles = self.iter_tiles(tile_size, progress_callback, root_table)
+        self.last_stats.add_allocation(full_image.nbytes + (full_labels.nbytes if return_labels else 0))
+        for y_start, x_start, iter_tile, labels_tile in tiles:
+            y_end = y_start + iter_tile.shape[0]
+            x_end = x_start + iter_tile.shape[1]
+            full_image[y_start:y_end, x_start:x_end] = iter_tile
+            if root_table is not None:
+                full_labels[y_start:y_end, x_start:x_end] = labels_tile
+
+        if root_table is not None:
+            labels, roots = root_table.finalize(full_labels)
+            return full_image, labels, roots
+        return full_image
+
+    def iter_tiles(self, tile_size='auto', progress_callback=None, root_table=None):
+        """
+        Generator yielding (y_start, x_start, iterations, labels) host arrays
+        as tiles finish, in completion order. labels is None unless a
+        RootTable is passed; its labels are in discovery order (see
+        RootTable.finalize). Only a few tiles per worker are in flight at a
+        time, so memory stays bounded however large the image is.
+        Statistics are collected in self.last_stats.
+        """
+        tile_size = self.resolve_tile_size(tile_size, labels=root_table is not None)
+        stats = self.last_stats = RenderStats(self, 'tiles')
+        return self._iter_tiles(stats, tile_size, progress_callback, root_table)
+
+    def _iter_tiles(self, stats, tile_size, progress_callback, root_table):
         if progress_callback:
             progress_callback(5)
 
-        total_tiles = (H // tile_size + (H % tile_size > 0)) * \
-                      (W // tile_size + (W % tile_size > 0))
+        tiles = list(self._tiles(tile_size))
+        total_tiles = len(tiles)
         tiles_computed = 0
 
-        y_coords = cp.linspace(self.ylim[0], self.ylim[1], H, dtype=cp.float32)
-        x_coords = cp.linspace(self.xlim[0], self.xlim[1], W, dtype=cp.float32)
+        def cached_tile(tile):
+            if self.tile_cache is None:
+                return None
+            tile_start = time.perf_counter()
+            y_start, y_end, x_start, x_end = tile
+            entry = self.tile_cache.get(self._tile_key(tile), need_labels=root_table is not None)
+            if entry is None:
+                return None
+            iter_tile, labels_tile, roots = entry
+            if root_table is not None:
+                labels_tile = root_table.import_labels(labels_tile, roots)
+            else:
+                labels_tile = None
+            stats.add_tile(y_start, x_start, y_end - y_start, x_end - x_start,
+                           time.perf_counter() - tile_start, cached=True)
+            return y_start, x_start, iter_tile, labels_tile
 
-        for y_start in range(0, H, tile_size):
-            for x_start in range(0, W, tile_size):
-                y_end = min(y_start + tile_size, H)
-                x_end = min(x_start + tile_size, W)
-
-                tile_H = y_end - y_start
-                tile_W = x_end - x_start
-                
-                # Create a grid for the current tile
-                tile_x = x_coords[x_start:x_end][None, :]
-                tile_y = y_coords[y_start:y_end][:, None]
-                Z_tile = tile_x + 1j * tile_y
-
-                iter_counts = cp.zeros_like(Z_tile.real, dtype=cp.float32)
-                mask = cp.ones_like(Z_tile.real, dtype=bool)
-
-                for i in range(self.max_iter):
-                    Z_prev = Z_tile.copy()
-                    
-                    active_Z = Z_tile[mask]
-                    if active_Z.size == 0:
-                        break # All pixels converged
-                    
-                    F = self.f_num(active_Z)
-                    dF = self.df_num(active_Z)
-
-                    # Guard against division by zero
-                    dF = cp.where(dF == 0, 1e-20 + 0j, dF)
-                    
-                    Z_tile[mask] = active_Z - F / dF
-                    
-                    moved = cp.abs(Z_tile - Z_prev) > self.tol
-                    iter_counts += moved.astype(cp.float32)
-                    mask = mask & moved
-                
-                # Normalize iteration counts for the tile
-                iter_norm_tile = iter_counts / self.max_iter
-                full_image[y_start:y_end, x_start:x_end, :] = cp.stack([iter_norm_tile, iter_norm_tile, iter_norm_tile], axis=2)
-                
-                tiles_computed += 1
-                if progress_callback:
-                    progress = 10 + int(90 * tiles_computed / total_tiles)
-                    progress_callback(progress)
+        def report_progress():
+            nonlocal tiles_computed
+            tiles_computed += 1
+            if progress_callback:
+                progress_callback(10 + int(90 * tiles_computed / total_tiles))
+
+        if self.coordinator is not None:
+            # Cached tiles are served locally, the rest by the coordinator's workers
+            missing = []
+            for tile in tiles:
+                result = cached_tile(tile)
+                if result is None:
+                    missing.append(tile)
+                    continue
+                report_progress()
+                yield result
+
+            for tile, iter_tile, labels_tile, roots, histogram, seconds in self.coordinator.run(
+                    self, missing, labels=root_table is not None):
+                y_start, y_end, x_start, x_end = tile
+                if self.tile_cache is not None:
+                    self.tile_cache.put(self._tile_key(tile), iter_tile, labels_tile, roots)
+                if root_table is not None:
+                    labels_tile = root_table.import_labels(labels_tile, roots)
+                stats.add_iterations(histogram)
+                stats.add_tile(y_start, x_start, y_end - y_start, x_end - x_start, seconds)
+                report_progress()
+                yield y_start, x_start, iter_tile, labels_tile
+
+            stats.finish()
+            if progress_callback:
+                progress_callback(100)
+            return
+
+        x_coords, y_coords = self._axes()
 
+        def render_tile(tile):
+            self._check_cancelled()
+            result = cached_tile(tile)
+            if result is not None:
+                return result
+            tile_start = time.perf_counter()
+            y_start, y_end, x_start, x_end = tile
+
+            iter_tile, labels_tile = self._compute_tile(
+                x_coords[x_start:x_end], y_coords[y_start:y_end], root_table)
+            transfer_start = time.perf_counter()
+            iter_tile = to_numpy(iter_tile)
+            if labels_tile is not None:
+                labels_tile = to_numpy(labels_tile)
+            if self.backend != 'numpy':
+                stats.add_transfer(iter_tile.nbytes + (labels_tile.nbytes if labels_tile is not None else 0),
+                                   time.perf_counter() - transfer_start)
+
+            if self.tile_cache is not None:
+                key = self._tile_key(tile)
+                if labels_tile is not None:
+                    self.tile_cache.put(key, iter_tile, *compact_labels(labels_tile, root_table.roots))
+                else:
+                    self.tile_cache.put(key, iter_tile)
+            stats.add_tile(y_start, x_start, y_end - y_start, x_end - x_start,
+                           time.perf_counter() - tile_start)
+            return y_start, x_start, iter_tile, labels_tile
+
+        workers = min(self.workers, total_tiles)
+        if workers <= 1:
+            for tile in tiles:
+                result = render_tile(tile)
+                report_progress()
+                yield result
+        else:
+            remaining = iter(tiles)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = {pool.submit(render_tile, tile)
+                           for tile in itertools.islice(remaining, 2 * workers)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for tile in itertools.islice(remaining, 1):
+                            pending.add(pool.submit(render_tile, tile))
+                        report_progress()
+                        yield future.result()
+
+        stats.finish()
         if progress_callback:
             progress_callback(100)
 
-        return cp.asnumpy(full_image)
\ No newline at end of file
+    def render_to_memmap(self, path, tile_size='auto', progress_callback=None, labels_path=None):
+        """
+        Stream the render into a .npy file opened as a memory map, so images
+        larger than RAM can be produced. With labels_path, root labels are
+        streamed to a second .npy file and the sorted roots are returned.
+        Returns the iteration memmap (and roots when labels_path is given).
+        """
+        H, W = self.height, self.width
+        tile_size = self.resolve_tile_size(tile_size, labels=labels_path is not None)
+        image = np.lib.format.open_memmap(path, mode='w+', dtype=self.iteration_dtype, shape=(H, W))
+        root_table = None
+        if labels_path is not None:
+            root_table = RootTable(self.root_tol)
+            labels = np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.uint16, shape=(H, W))
+
+        for y_start, x_start, iter_tile, labels_tile in self.iter_tiles(
+                tile_size, progress_callback, root_table):
+            y_end = y_start + iter_tile.shape[0]
+            x_end = x_start + iter_tile.shape[1]
+            image[y_start:y_end, x_start:x_end] = iter_tile
+            if root_table is not None:
+                labels[y_start:y_end, x_start:x_end] = labels_tile
+        image.flush()
+
+        if root_table is None:
+            return image
+
+        # Relabel to sorted root order one band at a time
+        remap = root_table.sorted_remap()
+        for y_start in range(0, H, tile_size):
+            labels[y_start:y_start + tile_size] = remap[labels[y_start:y_start + tile_size]]
+        labels.flush()
+        return image, root_table.sorted_roots()
+
+    def plan_tiles(self, labels=True):
+        """
+        TilePlan for the current image size, view and hardware; the first
+        call on a machine runs a short calibration that is cached on disk.
+        """
+        return plan_tiles(self, labels)
+
+    def resolve_tile_size(self, tile_size='auto', labels=True):
+        """
+        tile_size as an int, planning it (and recording self.last_plan) if 'auto'.
+        """
+        if tile_size != 'auto':
+            return int(tile_size)
+        self.last_plan = self.plan_tiles(labels)
+        return self.last_plan.tile_size
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise RenderCancelled()
+
+    def iter_progressive(self, strides=(8, 4, 2, 1), tile_size='auto', progress_callback=None):
+        """
+        Progressive refinement: yields (stride, preview) once per stride, where
+        preview holds the iteration counts of every stride-th pixel in both
+        directions, shape (ceil(height / stride), ceil(width / stride)).
+        Samples are reused between passes, so the last (stride 1) pass only
+        computes the pixels no coarser pass has covered and the whole
+        sequence costs about as much as a single full render.
+        Statistics are collected in self.last_stats.
+        """
+        tile_size = self.resolve_tile_size(tile_size, labels=False)
+        stats = self.last_stats = RenderStats(self, 'progressive')
+        return self._iter_progressive(stats, strides, tile_size, progress_callback)
+
+    def _iter_progressive(self, stats, strides, tile_size, progress_callback):
+        H, W = self.height, self.width
+        strides = [s for s in strides if s == 1 or s < min(H, W)]
+        x_coords, y_coords = self._axes()
+
+        image = np.zeros((H, W), dtype=self.iteration_dtype)
+        done = np.zeros((H, W), dtype=bool)
+        stats.add_allocation(image.nbytes + done.nbytes)
+
+        # Tiles already in the cache are filled in up front and skipped by every pass
+        missing_tiles = []
+        for tile in self._tiles(tile_size):
+            y_start, y_end, x_start, x_end = tile
+            entry = self.tile_cache.get(self._tile_key(tile)) if self.tile_cache is not None else None
+            if entry is None:
+                missing_tiles.append(tile)
+            else:
+                image[y_start:y_end, x_start:x_end] = entry[0]
+                done[y_start:y_end, x_start:x_end] = True
+
+        total_points = H * W - int(done.sum())
+        points_computed = 0
+
+        if progress_callback:
+            progress_callback(5)
+
+        for stride in strides:
+            self._check_cancelled()
+            pass_start = time.perf_counter()
+            # Tile by tile, so memory stays bounded by the tiles in flight
+            points_computed += self._progressive_pass(stats, stride, missing_tiles, image, done,
+                                                      x_coords, y_coords)
+            stats.add_tile(0, 0, -(-H // stride), -(-W // stride), time.perf_counter() - pass_start)
+
+            if progress_callback:
+                progress_callback(10 + int(90 * points_computed / max(total_points, 1)))
+
+            # Passes are not supersampled, so their tiles must not stand in for supersampled ones
+            if stride == 1 and self.tile_cache is not None and not self.supersample:
+                for tile in missing_tiles:
+                    y_start, y_end, x_start, x_end = tile
+                    self.tile_cache.put(self._tile_key(tile), image[y_start:y_end, x_start:x_end].copy())
+            if stride == strides[-1]:
+                stats.finish()
+            yield stride, image[::stride, ::stride]
+
+    def _progressive_pass(self, stats, stride, tiles, image, done, x_coords, y_coords):
+        """
+        Compute the stride-th pixels of tiles that no coarser pass has
+        covered, writing them into image and done. Tiles are spread over
+        the worker pool. Returns the number of points computed.
+        """
+        xp = self.xp
+
+        def run(tile):
+            self._check_cancelled()
+            y_start, y_end, x_start, x_end = tile
+            # First row and column of the tile on the stride grid
+            y0, x0 = -(-y_start // stride) * stride, -(-x_start // stride) * stride
+            row_idx, col_idx = np.nonzero(~done[y0:y_end:stride, x0:x_end:stride])
+            if row_idx.size == 0:
+                return 0
+            py, px = y0 + row_idx * stride, x0 + col_idx * stride
+            Z = x_coords[xp.asarray(px)] + 1j * y_coords[xp.asarray(py)]
+            self._record_allocation(Z.nbytes)
+            iter_counts, _ = self._iterate(Z)
+            transfer_start = time.perf_counter()
+            image[py, px] = to_numpy(iter_counts)
+            done[py, px] = True
+            if self.backend != 'numpy':
+                stats.add_transfer(iter_counts.nbytes, time.perf_counter() - transfer_start)
+            return py.size
+
+        workers = min(self.workers, len(tiles))
+        if workers <= 1:
+            return sum(run(tile) for tile in tiles)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(run, tiles))
+
+    def resolve_precision(self):
+        """
+        Concrete precision for the current view. With 'auto' this is the
+        cheapest sufficient one, or the most precise available if none is.
+        """
+        if self.precision != 'auto':
+            return self.precision
+        precision = choose_precision(self.xlim, self.ylim, self.width, self.height, self.tol, self.backend)
+        return precision or available_precisions(self.backend)[-1]
+
+    @property
+    def iteration_dtype(self):
+        if self.smooth or self.supersample:
+            return self.xp.float32
+        return self.xp.uint8 if self.max_iter <= 255 else self.xp.uint16
+
+    def _axes(self):
+        """
+        Pixel-center coordinates along x and y as backend arrays.
+        """
+        xp = self.xp
+        dtype = REAL_DTYPES[self.resolve_precision()]
+        if dtype is np.longdouble:
+            # Keep all the digits of the limits, which may themselves be long doubles
+            y_coords = np.linspace(np.longdouble(self.ylim[0]), np.longdouble(self.ylim[1]), self.height)
+            x_coords = np.linspace(np.longdouble(self.xlim[0]), np.longdouble(self.xlim[1]), self.width)
+        else:
+            y_coords = xp.linspace(float(self.ylim[0]), float(self.ylim[1]), self.height, dtype=dtype)
+            x_coords = xp.linspace(float(self.xlim[0]), float(self.xlim[1]), self.width, dtype=dtype)
+        return x_coords, y_coords
+
+    def _tile_key(self, tile):
+        """
+        TileCache key: the tile's world position and pixel scale plus
+        everything else that determines its pixels.
+        """
+        y_start, y_end, x_start, x_end = tile
+        dx = (self.xlim[1] - self.xlim[0]) / max(self.width - 1, 1)
+        dy = (self.ylim[1] - self.ylim[0]) / max(self.height - 1, 1)
+        # The kernel and backend change counts at chaotic pixels; root_tol decides the labels
+        return (normalize_expression(self.func_str), self.resolve_precision(),
+                self.backend, self.kernel, self.root_tol,
+                self.xlim[0] + x_start * dx, self.ylim[0] + y_start * dy, dx, dy,
+                y_end - y_start, x_end - x_start, self.max_iter, self.tol, self.smooth, self.supersample,
+                # Adaptive fills approximate counts, so they must not stand in for exact tiles
+                (self.adaptive, self.adaptive_min_size, self.adaptive_tolerance) if self.adaptive else False)
+
+    def _tiles(self, tile_size):
+        """
+        Yield (y_start, y_end, x_start, x_end) for every tile in row-major order.
+        """
+        H, W = self.height, self.width
+        for y_start in range(0, H, tile_size):
+            for x_start in range(0, W, tile_size):
+                yield y_start, min(y_start + tile_size, H), x_start, min(x_start + tile_size, W)
+
+    def _compute_tile(self, tile_x, tile_y, root_table=None):
+        """
+        Run Newton iteration over the grid spanned by tile_x and tile_y.
+        Returns iteration counts of shape (len(tile_y), len(tile_x)) and root
+        labels of the same shape (None without a root_table).
+        """
+        if self.supersample:
+            return self._compute_tile_supersampled(tile_x, tile_y, root_table)
+        return self._compute_tile_single(tile_x, tile_y, root_table)
+
+    def _compute_tile_single(self, tile_x, tile_y, root_table=None):
+        """_compute_tile with one sample per pixel."""
+        if self.adaptive:
+            return self._compute_tile_adaptive(tile_x, tile_y, root_table)
+
+        # Create a grid for the current tile
+        Z_tile = tile_x[None, :] + 1j * tile_y[:, None]
+        self._record_allocation(Z_tile.nbytes)
+
+        iter_counts, Z_final = self._iterate(Z_tile.ravel())
+
+        labels = None
+        if root_table is not None:
+            labels = self._label(root_table, Z_final, iter_counts < self.max_iter)
+            labels = labels.reshape(Z_tile.shape)
+
+        return iter_counts.reshape(Z_tile.shape).astype(self.iteration_dtype), labels
+
+    def _compute_tile_supersampled(self, tile_x, tile_y, root_table=None):
+        """
+        _compute_tile with extra samples on basin boundaries. The tile is
+        rendered with a one pixel apron so that boundaries along its edges
+        are found too, then only the boundary pixels are resampled. Labels
+        are those of the pixel centers, the extra samples only go into the
+        counts.
+        """
+        xp = self.xp
+        dx, dy = self._pixel_size(tile_x.dtype)
+        apron_x = xp.concatenate([tile_x[:1] - dx, tile_x, tile_x[-1:] + dx])
+        apron_y = xp.concatenate([tile_y[:1] - dy, tile_y, tile_y[-1:] + dy])
+        # Boundaries are found from roots, so label even if the caller doesn't want labels
+        table = root_table if root_table is not None else RootTable(self.root_tol)
+        iter_counts, labels = self._compute_tile_single(apron_x, apron_y, table)
+
+        boundary = self._boundary(iter_counts, labels)
+        iter_counts = iter_counts[1:-1, 1:-1].astype(xp.float32)
+        labels = labels[1:-1, 1:-1]
+
+        py, px = xp.nonzero(boundary)
+        if py.size:
+            offset_x, offset_y = _jitter_offsets(self.supersample)
+            offset_x = xp.asarray(offset_x.astype(tile_x.dtype)) * dx
+            offset_y = xp.asarray(offset_y.astype(tile_x.dtype)) * dy
+            Z = (tile_x[px][:, None] + offset_x) + 1j * (tile_y[py][:, None] + offset_y)
+            self._record_allocation(Z.nbytes)
+            counts, _ = self._iterate(Z.ravel())
+            total = iter_counts[py, px] + counts.reshape(Z.shape).sum(axis=1)
+            iter_counts[py, px] = total / (self.supersample + 1)
+        return iter_counts, (labels if root_table is not None else None)
+
+    def _boundary(self, iter_counts, labels):
+        """
+        Interior pixels of an apron-padded tile whose root differs from a
+        4-neighbour's, or whose count differs from one by more than a step.
+        """
+        xp = self.xp
+        counts = iter_counts.astype(xp.float32)
+        center_counts, center_labels = counts[1:-1, 1:-1], labels[1:-1, 1:-1]
+        boundary = xp.zeros(center_counts.shape, dtype=bool)
+        for ys, xs in ((slice(None, -2), slice(1, -1)), (slice(2, None), slice(1, -1)),
+                       (slice(1, -1), slice(None, -2)), (slice(1, -1), slice(2, None))):
+            boundary |= labels[ys, xs] != center_labels
+            boundary |= xp.abs(counts[ys, xs] - center_counts) > 1
+        return boundary
+
+    def _pixel_size(self, dtype):
+        """Distance between neighbouring pixel centers along x and y, in dtype."""
+        dtype = np.dtype(dtype).type
+        if dtype is np.longdouble:
+            xlim, ylim = [np.longdouble(v) for v in self.xlim], [np.longdouble(v) for v in self.ylim]
+        else:
+            xlim, ylim = [float(v) for v in self.xlim], [float(v) for v in self.ylim]
+        return (dtype((xlim[1] - xlim[0]) / max(self.width - 1, 1)),
+                dtype((ylim[1] - ylim[0]) / max(self.height - 1, 1)))
+
+    def _compute_tile_adaptive(self, tile_x, tile_y, root_table=None):
+        """
+        _compute_tile with Mariani-Silver subdivision. Rectangles are processed
+        one level at a time so that the border pixels of all rectangles at a
+        level are iterated in a single batch.
+        """
+        xp = self.xp
+        h, w = len(tile_y), len(tile_x)
+        iter_counts = np.zeros((h, w), dtype=np.float32)
+        labels = np.zeros((h, w), dtype=np.uint16)
+        computed = np.zeros((h, w), dtype=bool)
+        # Border agreement is judged on roots, so label even if the caller doesn't want labels
+        table = root_table if root_table is not None else RootTable(self.root_tol)
+        min_size = self.adaptive_min_size
+
+        rects = [(0, h, 0, w)]
+        while rects:
+            need = np.zeros((h, w), dtype=bool)
+            for y0, y1, x0, x1 in rects:
+                if y1 - y0 <= min_size or x1 - x0 <= min_size:
+                    need[y0:y1, x0:x1] = True
+                else:
+                    need[y0, x0:x1] = need[y1 - 1, x0:x1] = True
+                    need[y0:y1, x0] = need[y0:y1, x1 - 1] = True
+            need &= ~computed
+
+            py, px = np.nonzero(need)
+            if py.size:
+                Z = tile_x[xp.asarray(px)] + 1j * tile_y[xp.asarray(py)]
+                counts, Z_final = self._iterate(Z)
+                iter_counts[py, px] = to_numpy(counts)
+                labels[py, px] = to_numpy(self._label(table, Z_final, counts < self.max_iter))
+                computed[py, px] = True
+
+            next_rects = []
+            for y0, y1, x0, x1 in rects:
+                if y1 - y0 <= min_size or x1 - x0 <= min_size:
+                    continue
+                border = (np.s_[y0, x0:x1], np.s_[y1 - 1, x0:x1], np.s_[y0:y1, x0], np.s_[y0:y1, x1 - 1])
+                border_labels = np.concatenate([labels[b] for b in border])
+                border_counts = np.concatenate([iter_counts[b] for b in border])
+                label = border_labels[0]
+                if (label != 0 and (border_labels == label).all()
+                        and border_counts.max() - border_counts.min() <= self.adaptive_tolerance):
+                    # Uniform border: assume the interior converges the same way
+                    fill = border_counts.mean()
+                    iter_counts[y0 + 1:y1 - 1, x0 + 1:x1 - 1] = fill if self.smooth else np.round(fill)
+                    labels[y0 + 1:y1 - 1, x0 + 1:x1 - 1] = label
+                    computed[y0:y1, x0:x1] = True
+                else:
+                    ym, xm = (y0 + y1) // 2, (x0 + x1) // 2
+                    next_rects += [(y0, ym, x0, xm), (y0, ym, xm, x1), (ym, y1, x0, xm), (ym, y1, xm, x1)]
+            rects = next_rects
+            self._check_cancelled()
+
+        iter_counts = xp.asarray(iter_counts.astype(self.iteration_dtype))
+        return iter_counts, (xp.asarray(labels) if root_table is not None else None)
+
+    def _iterate(self, Z):
+        """
+        Iterate the flat array of starting points Z to convergence.
+        Returns (iteration counts as float32, final Z); the counts are
+        fractional with smooth=True.
+        """
+        # Numba has no long double support, so extended precision is always vectorized
+        if self.kernel == 'fused' and Z.dtype != np.clongdouble:
+            Z = self.xp.array(Z, copy=True)
+            iter_counts = self.xp.zeros(Z.shape, dtype=self.xp.float32)
+            self._fused_kernel(Z, self.max_iter, self.tol, iter_counts, self.smooth)
+        else:
+            # Overflow and NaN far from the roots are expected; the step test retires those points
+            with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+                if self.coefficients is not None:
+                    iter_counts, Z = self._iterate_polynomial(Z)
+                else:
+                    iter_counts, Z = self._iterate_vectorized(Z)
+
+        if self.last_stats is not None:
+            self.last_stats.add_allocation(Z.nbytes + iter_counts.nbytes)
+            histogram = self.xp.bincount(iter_counts.astype(self.xp.int32), minlength=self.max_iter + 1)
+            self.last_stats.add_iterations(to_numpy(histogram))
+        return iter_counts, Z
+
+    def _label(self, root_table, Z_final, converged):
+        """
+        Root labels of final iterates: the nearest known root for polynomials,
+        otherwise clustered by the root table.
+        """
+        if self.coefficients is None:
+            return root_table.label(self.xp, Z_final, converged)
+        xp = self.xp
+        nearest = xp.zeros(Z_final.shape, dtype=xp.uint16)
+        best = None
+        for k, root in enumerate(self._roots_for(Z_final.dtype)):
+            d = Z_final - root
+            distance = d.real * d.real + d.imag * d.imag
+            closer = distance < best if best is not None else xp.ones(Z_final.shape, dtype=bool)
+            nearest[closer] = k + 1
+            best = distance if best is None else xp.minimum(best, distance)
+        nearest[~converged] = 0
+        remap = xp.asarray(root_table.match_roots(self.roots.astype(np.complex128)))
+        return remap[nearest]
+
+    def _roots_for(self, dtype):
+        """Known roots as scalars that keep arithmetic in dtype."""
+        if dtype == np.clongdouble:
+            return list(self.roots)
+        return [complex(root) for root in self.roots]
+
+    def _smooth_counts(self, n, previous, last):
+        """Array version of function_cache.smooth_count for points stopped at step n."""
+        xp = self.xp
+        if n == 0:
+            return xp.zeros(last.shape, dtype=xp.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_previous = xp.log(previous)
+            fraction = (np.log(self.tol) - log_previous) / (xp.log(last) - log_previous)
+        # A point exactly on the root (last == 0) lies at the n - 1 end;
+        # overflowed (inf or nan) steps keep the integer count
+        fraction = xp.where(last <= 0, 0, xp.where(last < previous, fraction, 1))
+        fraction = xp.where(xp.isnan(fraction), 1, fraction)
+        return (n - 1 + xp.clip(fraction, 0, 1)).astype(xp.float32)
+
+    def _record_allocation(self, nbytes):
+        if self.last_stats is not None:
+            self.last_stats.add_allocation(nbytes)
+
+    def _iterate_vectorized(self, Z):
+        """
+        Array-at-a-time Newton iteration over a compacted active set.
+        Only still-moving points and their flat indices are carried from
+        step to step, so the cost of late iterations scales with the number
+        of active points rather than with the tile size.
+        """
+        xp = self.xp
+        Z = Z.copy()
+
+        iter_counts = xp.full(Z.shape, self.max_iter, dtype=xp.float32)
+        active_idx = xp.arange(Z.size)
+        active_Z = Z
+        # With smooth counts: each active point's last step size
+        active_step = None
+
+        for i in range(self.max_iter):
+            if active_idx.size == 0:
+                break # All pixels converged
+            self._check_cancelled()
+
+            F, dF = self.fdf_num(active_Z)
+
+            # Guard against division by zero
+            dF = xp.where(dF == 0, 1e-20 + 0j, dF)
+
+            Z_next = active_Z - F / dF
+            step = xp.abs(Z_next - active_Z)
+            moved = step > self.tol
+
+            # Retire points that stopped moving, keep compacting the rest
+            settled = ~moved
+            settled_idx = active_idx[settled]
+            Z[settled_idx] = Z_next[settled]
+            if self.smooth:
+                previous = active_step[settled] if active_step is not None else None
+                iter_counts[settled_idx] = self._smooth_counts(i, previous, step[settled])
+                active_step = step[moved]
+            else:
+                iter_counts[settled_idx] = i
+
+            active_idx = active_idx[moved]
+            active_Z = Z_next[moved]
+
+        Z[active_idx] = active_Z
+        return iter_counts, Z
+
+    def _iterate_polynomial(self, Z):
+        """
+        _iterate_vectorized for polynomials: a point retires once it is within
+        tol of a known root. Only points where |f| is small enough for that
+        to be possible are compared against the roots.
+        """
+        xp = self.xp
+        Z = Z.copy()
+        roots = self._roots_for(Z.dtype)
+        tol2 = self.tol * self.tol
+        f_bound = self._near_root_bound(Z.dtype)
+
+        iter_counts = xp.full(Z.shape, self.max_iter, dtype=xp.float32)
+        active_idx = xp.arange(Z.size)
+        active_Z = Z
+        # With smooth counts: each active point's last Newton step, which
+        # gives its previous distance to the root it ends up at
+        active_delta = None
+
+        for i in range(self.max_iter):
+            if active_idx.size == 0:
+                break # All pixels converged
+            self._check_cancelled()
+
+            F, dF = self.fdf_num(active_Z)
+
+            # Guard against division by zero
+            dF = xp.where(dF == 0, 1e-20 + 0j, dF)
+            delta = F / dF
+
+            # Points within tol of a root have |f| <= bound; confirm on the roots
+            candidates = xp.nonzero(xp.abs(F) <= f_bound)[0]
+            if candidates.size == 0:
+                active_Z = active_Z - delta
+                active_delta = delta
+                continue
+            Z_candidates = active_Z[candidates]
+            distance2 = offset = None
+            for root in roots:
+                d = Z_candidates - root
+                d2 = d.real * d.real + d.imag * d.imag
+                if distance2 is None:
+                    distance2, offset = d2, d
+                    continue
+                if self.smooth:
+                    offset = xp.where(d2 < distance2, d, offset)
+                distance2 = xp.minimum(distance2, d2)
+            close = distance2 <= tol2
+            near = xp.zeros(active_Z.shape, dtype=bool)
+            near[candidates[close]] = True
+
+            # Retire points that reached a root, step and keep compacting the rest
+            settled_idx = active_idx[near]
+            Z[settled_idx] = active_Z[near]
+            moving = ~near
+            if self.smooth:
+                # candidates are in increasing order, so close lines up with near
+                previous = xp.abs(offset[close] + active_delta[near]) if i > 0 else None
+                iter_counts[settled_idx] = self._smooth_counts(i, previous, xp.sqrt(distance2[close]))
+                active_delta = delta[moving]
+            else:
+                iter_counts[settled_idx] = i
+
+            active_idx = active_idx[moving]
+            active_Z = (active_Z - delta)[moving]
+
+        Z[active_idx] = active_Z
+        return iter_counts, Z
+
+    def _near_root_bound(self, dtype):
+        key = (self.tol, np.dtype(dtype).name)
+        if key not in self._near_root_bounds:
+            self._near_root_bounds[key] = near_root_bound(self.coefficients, self.roots, self.tol, dtype)
+        return self._near_root_bounds[key]
@@ -0,0 +1,351 @@
+"""
+Symbolic-to-numeric compilation of Newton functions, and a process-wide
+LRU cache so the same f(z) is only parsed, differentiated and lambdified once.
+"""
+import cmath
+import hashlib
+import math
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+from mpmath.libmp import NoConvergence
+from sympy.printing.lambdarepr import LambdaPrinter
+from sympy.printing.precedence import PRECEDENCE
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+Z_SYMBOL = sp.symbols('z')
+
+# Beyond this degree testing the distance to every root each step costs
+# more than the generic step-size test saves
+POLYNOMIAL_MAX_DEGREE = 32
+
+
+def default_cache_dir():
+    """
+    Directory for on-disk caches: $NEWTON_FRACTAL_CACHE_DIR or ~/.cache/newton_fractal.
+    """
+    return os.environ.get('NEWTON_FRACTAL_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'newton_fractal'))
+
+
+def normalize_expression(func_str):
+    """
+    Cache key for an expression string: whitespace is not significant.
+    """
+    return ''.join(func_str.split())
+
+
+def newton_expressions(f_sym, df_sym, z):
+    """
+    Return (f, f') rewritten for evaluation: Horner form for polynomials,
+    unchanged otherwise.
+    """
+    if f_sym.is_polynomial(z):
+        return sp.horner(f_sym, wrt=z), sp.horner(df_sym, wrt=z)
+    return f_sym, df_sym
+
+
+def polynomial_roots(f_sym, z):
+    """
+    For a polynomial f of degree 1 to POLYNOMIAL_MAX_DEGREE with numeric
+    coefficients, return (coefficients, roots): coefficients as complex128,
+    highest degree first, and the distinct roots as clongdouble (from the
+    square-free part, so repeated roots appear once). Otherwise (None, None).
+    """
+    if not f_sym.is_polynomial(z):
+        return None, None
+    try:
+        poly = sp.Poly(f_sym, z)
+        coefficients = np.array([complex(c) for c in poly.all_coeffs()], dtype=np.complex128)
+    except (sp.PolynomialError, TypeError):
+        return None, None
+    # e.g. zoo from a division by zero that sympify folded away
+    if not 1 <= poly.degree() <= POLYNOMIAL_MAX_DEGREE or not np.isfinite(coefficients).all():
+        return None, None
+
+    square_free = poly.sqf_part()
+    try:
+        roots = [(sp.re(r), sp.im(r)) for r in square_free.nroots(n=30, maxsteps=200)]
+        roots = np.array([np.longdouble(str(re)) + 1j * np.longdouble(str(im)) for re, im in roots],
+                         dtype=np.clongdouble)
+    except NoConvergence:
+        roots = np.roots([complex(c) for c in square_free.all_coeffs()]).astype(np.clongdouble)
+    return coefficients, roots
+
+
+def build_fdf(f_sym, df_sym, z, module, printer=None):
+    """
+    Lambdify f and f' into one function returning (F, dF), with common
+    subexpressions such as z**3 or sin(z**3) computed only once.
+    """
+    f_expr, df_expr = newton_expressions(f_sym, df_sym, z)
+    return sp.lambdify(z, (f_expr, df_expr), module, printer=printer, cse=True)
+
+
+class _ScalarPrinter(LambdaPrinter):
+    """
+    Prints small integer powers as repeated multiplication. Numba lowers
+    complex ** int to the generic exp/log pow, which is many times slower.
+    """
+    def _print_Pow(self, expr, rational=False):
+        base, exp = expr.as_base_exp()
+        if exp.is_Integer and 2 <= abs(exp) <= 8:
+            base_str = self.parenthesize(base, PRECEDENCE['Mul'])
+            product = '*'.join([base_str] * abs(int(exp)))
+            return f"({product})" if exp > 0 else f"(1/({product}))"
+        return super()._print_Pow(expr, rational=rational)
+
+
+def smooth_count(n, previous, last, tol):
+    """
+    Fractional iteration count of a point that stopped after n steps:
+    previous and last are its distances to convergence before and after
+    crossing tol (step sizes, or distances to the root). The count
+    interpolates in log distance between n - 1 and n, so it is continuous
+    across the bands of integer counts.
+    """
+    if n == 0:
+        return 0.0
+    if last <= 0.0:
+        return n - 1.0
+    if not last < previous:
+        return float(n)  # Also overflowed (inf or nan) steps
+    fraction = (math.log(tol) - math.log(previous)) / (math.log(last) - math.log(previous))
+    if math.isnan(fraction):
+        return float(n)
+    return n - 1.0 + min(max(fraction, 0.0), 1.0)
+
+
+def build_fused_kernel(f_sym, df_sym, z):
+    """
+    Compile f and f' into a single Numba kernel that iterates each point
+    to convergence in registers, with early exit per point.
+    The kernel updates Z in place and writes step counts into iter_counts,
+    fractional ones (see smooth_count) if smooth is true.
+    """
+    if numba is None:
+        raise ImportError("The 'fused' kernel requires Numba to be installed")
+
+    # Scalar functions over cmath, which Numba knows how to compile
+    printer = _ScalarPrinter({'fully_qualified_modules': False, 'inline': True,
+                              'allow_unknown_functions': True})
+    fdf_scalar = numba.njit(build_fdf(f_sym, df_sym, z, [vars(cmath)], printer=printer))
+    fractional = numba.njit(smooth_count)
+
+    @numba.njit(nogil=True)
+    def kernel(Z, max_iter, tol, iter_counts, smooth=False):
+        for k in range(Z.shape[0]):
+            z_k = complex(Z[k])
+            n = 0
+            previous = step = tol
+            for _ in range(max_iter):
+                F, dF = fdf_scalar(z_k)
+                dF = complex(dF)
+                # Guard against division by zero
+                if dF == 0:
+                    dF = 1e-20 + 0j
+                z_next = z_k - complex(F) / dF
+                previous, step = step, abs(z_next - z_k)
+                z_k = z_next
+                # Written so a NaN step stops too, as in the vectorized path
+                if not step > tol:
+                    break
+                n += 1
+            Z[k] = z_k
+            if smooth and n < max_iter:
+                iter_counts[k] = fractional(n, previous, step, tol)
+            else:
+                iter_counts[k] = n
+
+    return kernel
+
+
+def near_root_bound(coefficients, roots, tol, dtype):
+    """
+    Upper bound of |f| within tol of any root, including the rounding error
+    of evaluating f in dtype; points with a larger |f| cannot have converged.
+    The maximum of |f| over each disk is on its rim.
+    """
+    rim = np.exp(2j * np.pi * np.arange(64) / 64)
+    eps = np.finfo(np.dtype(dtype)).eps
+    magnitudes = np.abs(coefficients)
+    bound = 0.0
+    for root in np.asarray(roots, dtype=np.complex128):
+        values = np.polyval(coefficients, root + tol * rim)
+        noise = 8 * eps * np.polyval(magnitudes, abs(root) + tol)
+        bound = max(bound, float(np.abs(values).max()), float(noise))
+    return 4 * bound
+
+
+def build_polynomial_kernel(f_sym, df_sym, z, coefficients, roots):
+    """
+    build_fused_kernel for a polynomial with known roots: a point stops once
+    it is within tol of a root instead of after a step shorter than tol.
+    With few roots they are checked before evaluating f, saving the last
+    evaluation; otherwise only where |f| is small enough to be near one.
+    """
+    if numba is None:
+        raise ImportError("The 'fused' kernel requires Numba to be installed")
+
+    printer = _ScalarPrinter({'fully_qualified_modules': False, 'inline': True,
+                              'allow_unknown_functions': True})
+    fdf_scalar = numba.njit(build_fdf(f_sym, df_sym, z, [vars(cmath)], printer=printer))
+    roots = np.ascontiguousarray(roots, dtype=np.complex128)
+    check_first = roots.size <= 4
+
+    fractional = numba.njit(smooth_count)
+
+    @numba.njit
+    def nearest_offset(z_k):
+        """z_k minus its nearest root."""
+        best = z_k - roots[0]
+        for r in roots[1:]:
+            d = z_k - r
+            if d.real * d.real + d.imag * d.imag < best.real * best.real + best.imag * best.imag:
+                best = d
+        return best
+
+    @numba.njit(nogil=True)
+    def iterate(Z, max_iter, tol, iter_counts, f_bound2, smooth):
+        tol2 = tol * tol
+        for k in range(Z.shape[0]):
+            z_k = complex(Z[k])
+            n = max_iter
+            offset = delta = 0j
+            for i in range(max_iter):
+                if check_first:
+                    offset = nearest_offset(z_k)
+                    if offset.real * offset.real + offset.imag * offset.imag <= tol2:
+                        n = i
+                        break
+                F, dF = fdf_scalar(z_k)
+                F = complex(F)
+                if not check_first and F.real * F.real + F.imag * F.imag <= f_bound2:
+                    offset = nearest_offset(z_k)
+                    if offset.real * offset.real + offset.imag * offset.imag <= tol2:
+                        n = i
+                        break
+                dF = complex(dF)
+                # Guard against division by zero
+                if dF == 0:
+                    dF = 1e-20 + 0j
+                delta = F / dF
+                z_k = z_k - delta
+            Z[k] = z_k
+            if smooth and n < max_iter:
+                # The last step gives the previous distance to the same root
+                iter_counts[k] = fractional(n, abs(offset + delta), abs(offset), tol)
+            else:
+                iter_counts[k] = n
+
+    def kernel(Z, max_iter, tol, iter_counts, smooth=False):
+        f_bound = near_root_bound(coefficients, roots, tol, np.complex128)
+        iterate(Z, max_iter, tol, iter_counts, f_bound * f_bound, smooth)
+
+    return kernel
+
+
+class CompiledFunction:
+    """
+    Parsed, differentiated and lambdified form of one f(z) for one backend.
+    For polynomials, coefficients and roots are set (see polynomial_roots).
+    The Numba kernel is only built the first time it is requested.
+    """
+    def __init__(self, f_sym, df_sym, backend):
+        self.f_sym = f_sym
+        self.df_sym = df_sym
+        self.backend = backend
+        self.fdf_num = build_fdf(f_sym, df_sym, Z_SYMBOL, backend)
+        self.coefficients, self.roots = polynomial_roots(f_sym, Z_SYMBOL)
+        self._fused_kernel = None
+        self._lock = threading.Lock()
+
+    def fused_kernel(self):
+        with self._lock:
+            if self._fused_kernel is None and self.coefficients is not None:
+                self._fused_kernel = build_polynomial_kernel(self.f_sym, self.df_sym, Z_SYMBOL,
+                                                             self.coefficients, self.roots)
+            elif self._fused_kernel is None:
+                self._fused_kernel = build_fused_kernel(self.f_sym, self.df_sym, Z_SYMBOL)
+            return self._fused_kernel
+
+
+class FunctionCache:
+    """
+    Thread-safe LRU cache of CompiledFunction keyed on (normalized expression, backend).
+    With persist=True the symbolic stage (sympify and diff) is also stored
+    under cache_dir, so it survives process restarts.
+    """
+    def __init__(self, maxsize=64, persist=False, cache_dir=None):
+        self.maxsize = maxsize
+        self.persist = persist
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'functions')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, func_str, backend='numpy'):
+        key = (normalize_expression(func_str), backend)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+
+        f_sym, df_sym = self._symbolic(key[0])
+        compiled = CompiledFunction(f_sym, df_sym, backend)
+
+        with self._lock:
+            # Another thread may have compiled the same key meanwhile; keep the first
+            compiled = self._entries.setdefault(key, compiled)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _symbolic(self, expression):
+        path = None
+        if self.persist:
+            digest = hashlib.sha256(expression.encode('utf-8')).hexdigest()
+            path = os.path.join(self.cache_dir, f"{digest}.pkl")
+            try:
+                with open(path, 'rb') as fh:
+                    entry = pickle.load(fh)
+                if entry['expression'] == expression and entry['sympy'] == sp.__version__:
+                    return entry['f_sym'], entry['df_sym']
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+                pass
+
+        f_sym = sp.sympify(expression)
+        df_sym = sp.diff(f_sym, Z_SYMBOL)
+
+        if path is not None:
+            entry = {'expression': expression, 'sympy': sp.__version__,
+                     'f_sym': f_sym, 'df_sym': df_sym}
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as fh:
+                    pickle.dump(entry, fh)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass # The disk cache is best effort
+        return f_sym, df_sym
+
+
+# Process-wide cache used by NewtonFractalEngine unless another one is passed in.
+# Set NEWTON_FRACTAL_PERSIST_FUNCTIONS=1 to also keep parsed functions on disk.
+default_function_cache = FunctionCache(
+    persist=os.environ.get('NEWTON_FRACTAL_PERSIST_FUNCTIONS') == '1'
+)
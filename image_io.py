@@ -0,0 +1,139 @@
+"""
+Streaming image output: scanline bands are written as they are rendered,
+so the full image never has to be held in memory.
+"""
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+from coloring import colorize_basins, colorize_iterations
+
+
+class PNGStreamWriter:
+    """
+    Minimal PNG encoder (8-bit grayscale or RGB) that accepts rows in
+    order, in bands of any height, and compresses them incrementally.
+    """
+    def __init__(self, path, width, height, channels=1, compress_level=6):
+        if channels not in (1, 3):
+            raise ValueError("channels must be 1 (grayscale) or 3 (RGB)")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._fh = open(path, 'wb')
+
+        color_type = 0 if channels == 1 else 2
+        self._fh.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def write_rows(self, rows):
+        """
+        Append a (rows, width) or (rows, width, 3) uint8 band.
+        """
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        if rows.shape[1] != self.width * self.channels:
+            raise ValueError("band width does not match the image")
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("more rows written than the image height")
+
+        # Each scanline is prefixed with filter type 0 (None)
+        filtered = np.zeros((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self._fh.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"only {self.rows_written} of {self.height} rows were written")
+            self._chunk(b'IDAT', self._compressor.flush())
+            self._chunk(b'IEND', b'')
+        finally:
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fh.close()
+
+    def _chunk(self, kind, data):
+        self._fh.write(struct.pack('>I', len(data)))
+        self._fh.write(kind)
+        self._fh.write(data)
+        self._fh.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def render_png(engine, path, tile_size='auto', progress_callback=None, basins=False):
+    """
+    Render engine straight to a PNG file, one band of tile rows at a time.
+    Tiles finish out of order, so each band is buffered until complete and
+    bands are flushed to disk in order. With basins=True pixels are colored
+    by root instead of grayscale iteration counts, roots in sorted order as
+    compute() returns them; see _render_basins_png.
+    """
+    if basins:
+        return _render_basins_png(engine, path, tile_size, progress_callback)
+    H, W = engine.height, engine.width
+    tile_size = engine.resolve_tile_size(tile_size, labels=False)
+    tiles_per_band = -(-W // tile_size)
+
+    bands = {}
+    next_band = 0
+    with PNGStreamWriter(path, W, H) as writer:
+        for y_start, x_start, iter_tile, _ in engine.iter_tiles(tile_size, progress_callback):
+            if y_start not in bands:
+                bands[y_start] = [np.zeros((min(tile_size, H - y_start), W), dtype=iter_tile.dtype),
+                                  tiles_per_band]
+            band = bands[y_start]
+            band[0][:, x_start:x_start + iter_tile.shape[1]] = iter_tile
+            band[1] -= 1
+
+            while next_band in bands and bands[next_band][1] == 0:
+                iterations, _ = bands.pop(next_band)
+                writer.write_rows(colorize_iterations(iterations, engine.max_iter))
+                next_band += tile_size
+
+
+def _render_basins_png(engine, path, tile_size, progress_callback):
+    """
+    Root colors depend on the sorted order of all roots, which is only
+    known once every tile is done, so counts and labels are rendered to
+    temporary memory maps next to path first and colored band by band after.
+    """
+    H, W = engine.height, engine.width
+    tile_size = engine.resolve_tile_size(tile_size, labels=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp_dir:
+        iterations, roots = engine.render_to_memmap(os.path.join(tmp_dir, 'iterations.npy'), tile_size,
+                                                    progress_callback, os.path.join(tmp_dir, 'labels.npy'))
+        labels = np.load(os.path.join(tmp_dir, 'labels.npy'), mmap_mode='r')
+        with PNGStreamWriter(path, W, H, channels=3) as writer:
+            for y_start in range(0, H, tile_size):
+                band = np.s_[y_start:y_start + tile_size]
+                writer.write_rows(colorize_basins(labels[band], iterations[band], engine.max_iter, roots.size))
+        del iterations, labels  # Release the maps before the directory is removed
+
+
+def save_png(path, iterations, max_iter, labels=None, n_roots=0):
+    """
+    Write a computed image (e.g. from a render cache) as PNG: grayscale
+    iteration counts, or basins colored by root when labels are given.
+    """
+    H, W = iterations.shape
+    with PNGStreamWriter(path, W, H, channels=1 if labels is None else 3) as writer:
+        if labels is None:
+            writer.write_rows(colorize_iterations(iterations, max_iter))
+        else:
+            writer.write_rows(colorize_basins(labels, iterations, max_iter, n_roots))
@@ -1,41 +1,137 @@
 # main.py
 import sys
+import threading
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit,
     QTabWidget, QLabel, QProgressBar, QHBoxLayout, QSpinBox,
     QStyleFactory, QSizePolicy, QFileDialog
 )
-from PyQt6.QtGui import QPixmap, QImage, QPainter, QPalette, QColor
+from PyQt6.QtGui import QImage, QPainter, QPalette, QColor
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QPoint, QRect, QSize
 import numpy as np
-from fractal_engine import NewtonFractalEngine
+from fractal_engine import NewtonFractalEngine, RenderCancelled, choose_precision, resolve_backend
+from tile_cache import TileCache
+from render_cache import RenderCache
+from coloring import colorize_iterations, downsample
+
+
+def gray_qimage(gray):
+    """
+    QImage viewing a (H, W) uint8 buffer without copying it. The caller
+    must keep gray alive for as long as the image is used.
+    """
+    gray = np.ascontiguousarray(gray, dtype=np.uint8)
+    return QImage(gray.data, gray.shape[1], gray.shape[0], gray.strides[0],
+                  QImage.Format.Format_Grayscale8)
+
+
+class ZoomLabel(QLabel):
+    """
+    Shows a display buffer scaled to fit, with the zoom selection drawn on
+    top at paint time, so dragging never copies or rebuilds the image.
+    """
+    def __init__(self):
+        super().__init__()
+        self.selection = None  # QRect in widget coordinates, or None
+        self._buffer = None  # Keeps the memory behind _image alive
+        self._image = None
+
+    def set_image(self, gray):
+        self._buffer = np.ascontiguousarray(gray, dtype=np.uint8)
+        self._image = gray_qimage(self._buffer)
+        self.update()
+
+    def image_rect(self):
+        """Where the image is drawn: centered, scaled to fit, aspect kept."""
+        area = self.contentsRect()
+        if self._image is None:
+            return area
+        size = self._image.size().scaled(area.size(), Qt.AspectRatioMode.KeepAspectRatio)
+        return QRect(area.x() + (area.width() - size.width()) // 2,
+                     area.y() + (area.height() - size.height()) // 2,
+                     size.width(), size.height())
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._image is None:
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawImage(self.image_rect(), self._image)
+        if self.selection is not None:
+            painter.setPen(Qt.GlobalColor.red)
+            painter.drawRect(self.selection)
+        painter.end()
+
 
 class FractalWorker(QThread):
-    finished = pyqtSignal(np.ndarray)
+    # (iteration counts, display buffer); QThread.finished follows once run() returns
+    rendered = pyqtSignal(np.ndarray, np.ndarray)
+    preview = pyqtSignal(np.ndarray)
+    cancelled = pyqtSignal()
     progress = pyqtSignal(int)
 
-    def __init__(self, func_str, width, height, xlim, ylim):
+    def __init__(self, func_str, width, height, xlim, ylim, max_iter, tol, tile_cache=None, render_cache=None,
+                 display_size=(600, 500)):
         super().__init__()
         self.func_str = func_str
         self.width = width
         self.height = height
         self.xlim = xlim
         self.ylim = ylim
+        self.max_iter = max_iter
+        self.tol = tol
+        self.tile_cache = tile_cache
+        self.render_cache = render_cache
+        # Images are shrunk and colored here, off the GUI thread, for a view this large
+        self.display_size = display_size
+        self.cancel_event = threading.Event()
+
+    def display(self, img):
+        return colorize_iterations(downsample(img, *self.display_size), self.max_iter)
+
+    def cancel(self):
+        # Cooperative: the engine stops at the next tile or Newton step
+        self.cancel_event.set()
 
     def run(self):
         engine = NewtonFractalEngine(
             func_str=self.func_str,
             width=self.width,
-            height=self.height
+            height=self.height,
+            max_iter=self.max_iter,
+            tol=self.tol,
+            cancel_event=self.cancel_event,
+            tile_cache=self.tile_cache,
+            smooth=True  # Band-free shading without raising the resolution multiplier
         )
         engine.xlim = self.xlim
         engine.ylim = self.ylim
         
         def progress_callback(percent):
             self.progress.emit(percent)
+
+        # Views rendered before (in this or an earlier session) come straight from disk
+        if self.render_cache is not None:
+            key = self.render_cache.key(engine)
+            entry = self.render_cache.get(key)
+            if entry is not None:
+                self.progress.emit(100)
+                self.rendered.emit(entry[0], self.display(entry[0]))
+                return
         
-        image = engine.compute(progress_callback=progress_callback)
-        self.finished.emit(image)
+        # Coarse passes are shown as they arrive; the last pass is the full image
+        try:
+            for stride, image in engine.iter_progressive(progress_callback=progress_callback):
+                if stride > 1:
+                    self.preview.emit(self.display(image))
+        except RenderCancelled:
+            self.cancelled.emit()
+            return
+        self.rendered.emit(image, self.display(image))
+        # Stored after the view is shown, compressing a large render takes a while
+        if self.render_cache is not None:
+            self.render_cache.put(key, image)
 
 class FractalTab(QWidget):
     def __init__(self, width=600, height=500):
@@ -43,8 +139,14 @@ class FractalTab(QWidget):
         self.base_width = width
         self.base_height = height
         self.zoom_level = 0
-        self.max_zoom_level = 5
+        # Deep zooms are limited by numeric precision (see mouse_release), not by this cap
+        self.max_zoom_level = 100
+        self.max_iter = 50
+        self.tol = 1e-6
         self.worker = None
+        self.pending_request = None  # Latest viewport waiting for the running render to stop
+        self.tile_cache = TileCache()  # Lets reset/revisited views skip already rendered tiles
+        self.render_cache = RenderCache()  # Whole views, kept on disk across sessions
 
         layout = QVBoxLayout()
         layout.setSpacing(8)  # Reduced spacing
@@ -295,7 +397,7 @@ class FractalTab(QWidget):
         layout.addWidget(self.progress)
 
         # Image display with fixed size policy
-        self.label = QLabel()
+        self.label = ZoomLabel()
         self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.label.setMouseTracking(True)
         self.label.setStyleSheet("""
@@ -309,15 +411,15 @@ class FractalTab(QWidget):
         self.label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.label.setMinimumSize(400, 300)  # Smaller minimum
         layout.addWidget(self.label)
-        
-        self.pix = QPixmap()
-        self._original_pixmap = QPixmap()
 
         # Zoom state
         self.start_pos = None
         self.end_pos = None
         self.xlim = (-2, 2)
         self.ylim = (-2, 2)
+        # View of the image on screen; xlim/ylim run ahead of it while a render is pending
+        self.shown_xlim = self.xlim
+        self.shown_ylim = self.ylim
         self.current_image = None  # Store current image for saving
 
         # Connections
@@ -333,11 +435,28 @@ class FractalTab(QWidget):
         self.label.mouseReleaseEvent = self.mouse_release
 
     def compute_fractal(self):
+        res_multiplier = self.res_spinbox.value()
+        self.pending_request = (
+            self.func_input.text(),
+            self.base_width * res_multiplier,
+            self.base_height * res_multiplier,
+            self.xlim,
+            self.ylim,
+            self.max_iter,
+            self.tol
+        )
+
         if self.worker and self.worker.isRunning():
-            self.worker.quit()
-            self.worker.wait()
+            # Coalesce rapid requests: cancel the running render and only keep
+            # the latest viewport, which starts once the worker has stopped
+            self.worker.cancel()
+            return
+        self.start_pending_render()
+
+    def start_pending_render(self):
+        request, self.pending_request = self.pending_request, None
+        self.current_width, self.current_height = request[1:3]
 
-        func_str = self.func_input.text()
         self.compute_btn.setEnabled(False)
         self.reset_btn.setEnabled(False)
         self.recompute_btn.setEnabled(False)
@@ -345,24 +464,48 @@ class FractalTab(QWidget):
         self.progress.setValue(0)
         self.progress.show()
 
-        res_multiplier = self.res_spinbox.value()
-        self.current_width = self.base_width * res_multiplier
-        self.current_height = self.base_height * res_multiplier
-
-        self.worker = FractalWorker(
-            func_str,
-            self.current_width,
-            self.current_height,
-            self.xlim,
-            self.ylim
-        )
-        self.worker.finished.connect(self.on_worker_finished)
+        display_size = self.label.contentsRect().size()
+        self.worker = FractalWorker(*request, tile_cache=self.tile_cache, render_cache=self.render_cache,
+                                    display_size=(display_size.width(), display_size.height()))
+        self.worker.rendered.connect(self.on_worker_rendered)
+        self.worker.finished.connect(self.on_worker_stopped)
+        self.worker.preview.connect(self.on_worker_preview)
+        self.worker.cancelled.connect(self.on_worker_cancelled)
         self.worker.progress.connect(self.update_progress)
         self.worker.start()
 
-    def on_worker_finished(self, img):
+    def on_worker_preview(self, display):
+        # Previews of a render that is being replaced show the wrong viewport
+        if self.sender() is self.worker and self.pending_request is None:
+            self.show_image(display)
+
+    def on_worker_cancelled(self):
+        if self.sender() is self.worker and self.pending_request is None:
+            self.on_render_stopped()
+
+    def on_worker_rendered(self, img, display):
+        # Queued signals of a replaced worker can arrive after the new one started
+        if self.sender() is not self.worker:
+            return
+        if self.pending_request is not None:
+            # A newer viewport was requested while this one was finishing
+            return
+
         self.current_image = img  # Store for saving
-        self.display_image(img)
+        self.show_image(display)
+        self.on_render_stopped()
+
+    def show_image(self, display):
+        self.label.set_image(display)
+        self.shown_xlim, self.shown_ylim = self.worker.xlim, self.worker.ylim
+
+    def on_worker_stopped(self):
+        # The thread may still be storing the render in the cache after
+        # rendered, so a pending viewport only starts once run() has returned
+        if self.sender() is self.worker and self.pending_request is not None:
+            self.start_pending_render()
+
+    def on_render_stopped(self):
         self.progress.hide()
         self.compute_btn.setEnabled(True)
         self.reset_btn.setEnabled(True)
@@ -372,53 +515,41 @@ class FractalTab(QWidget):
     def update_progress(self, value):
         self.progress.setValue(value)
 
-    def display_image(self, img):
-        img = np.clip(img * 255, 0, 255).astype(np.uint8)
-        if img.shape[2] == 3:
-            qimg = QImage(img, img.shape[1], img.shape[0], QImage.Format.Format_RGB888)
-        else:
-            qimg = QImage(img, img.shape[1], img.shape[0], QImage.Format.Format_Grayscale8)
-
-        self.full_res_pix = QPixmap.fromImage(qimg)
-        
-        # Scale the pixmap to fit the label's current size
-        label_size = self.label.size()
-        self.pix = self.full_res_pix.scaled(label_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        self.label.setPixmap(self.pix)
-        
     # Mouse events
     def mouse_press(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.start_pos = event.pos()
             self.end_pos = event.pos()
-            self._original_pixmap = self.pix.copy()
 
     def mouse_move(self, event):
         if self.start_pos:
             self.end_pos = event.pos()
-            temp_pix = self._original_pixmap.copy()
-            painter = QPainter(temp_pix)
-            painter.setPen(Qt.GlobalColor.red)
 
             dx = self.end_pos.x() - self.start_pos.x()
             dy = self.end_pos.y() - self.start_pos.y()
             side = min(abs(dx), abs(dy))
 
             rect = QRect(self.start_pos, QPoint(self.start_pos.x() + (side if dx > 0 else -side), self.start_pos.y() + (side if dy > 0 else -side)))
-            painter.drawRect(rect.normalized())
-            painter.end()
-            self.label.setPixmap(temp_pix)
-            self.label.repaint()
+            # Only the overlay changes; the label repaints the image as is
+            self.label.selection = rect.normalized()
+            self.label.update()
 
     def mouse_release(self, event):
+        self.label.selection = None
+        self.label.update()
         if self.start_pos and event.button() == Qt.MouseButton.LeftButton and self.zoom_level < self.max_zoom_level:
-            x_scale = (self.xlim[1] - self.xlim[0]) / self.pix.width()
-            y_scale = (self.ylim[1] - self.ylim[0]) / self.pix.height()
-
-            start_x = self.start_pos.x()
-            start_y = self.start_pos.y()
-            end_x = event.pos().x()
-            end_y = event.pos().y()
+            # Positions are relative to the image, which is centered in the label
+            image_rect = self.label.image_rect()
+            # The selection is on the image shown, not on a view still being rendered
+            xlim, ylim = self.shown_xlim, self.shown_ylim
+            # Long doubles keep deep-zoom limits from collapsing to float64
+            x_scale = (np.longdouble(xlim[1]) - xlim[0]) / image_rect.width()
+            y_scale = (np.longdouble(ylim[1]) - ylim[0]) / image_rect.height()
+
+            start_x = self.start_pos.x() - image_rect.x()
+            start_y = self.start_pos.y() - image_rect.y()
+            end_x = event.pos().x() - image_rect.x()
+            end_y = event.pos().y() - image_rect.y()
 
             dx = end_x - start_x
             dy = end_y - start_y
@@ -426,19 +557,25 @@ class FractalTab(QWidget):
             end_x = start_x + (side if dx > 0 else -side)
             end_y = start_y + (side if dy > 0 else -side)
 
-            x0 = self.xlim[0] + min(start_x, end_x) * x_scale
-            x1 = self.xlim[0] + max(start_x, end_x) * x_scale
-            y0 = self.ylim[0] + min(start_y, end_y) * y_scale
-            y1 = self.ylim[0] + max(start_y, end_y) * y_scale
+            x0 = xlim[0] + min(start_x, end_x) * x_scale
+            x1 = xlim[0] + max(start_x, end_x) * x_scale
+            y0 = ylim[0] + min(start_y, end_y) * y_scale
+            y1 = ylim[0] + max(start_y, end_y) * y_scale
+
+            self.start_pos = None
+            self.end_pos = None
+
+            res_multiplier = self.res_spinbox.value()
+            if choose_precision((x0, x1), (y0, y1), self.base_width * res_multiplier,
+                                self.base_height * res_multiplier, self.tol, resolve_backend()[0]) is None:
+                # Too deep for any available precision, keep the current view
+                return
 
             self.xlim = (x0, x1)
             self.ylim = (y0, y1)
             self.zoom_level += 1
 
-            self.start_pos = None
-            self.end_pos = None
             self.compute_fractal()
-            self.label.setPixmap(self.pix)
 
     def reset_zoom(self):
         self.xlim = (-2, 2)
@@ -468,19 +605,15 @@ class FractalTab(QWidget):
         )
         
         if filename:
-            # Convert numpy array to QImage and save
-            img = np.clip(self.current_image * 255, 0, 255).astype(np.uint8)
-            if img.shape[2] == 3:
-                qimg = QImage(img, img.shape[1], img.shape[0], QImage.Format.Format_RGB888)
-            else:
-                qimg = QImage(img, img.shape[1], img.shape[0], QImage.Format.Format_Grayscale8)
-            
-            qimg.save(filename)
+            # The engine returns raw iteration counts; colorize only for export
+            gray = colorize_iterations(self.current_image, self.max_iter)
+            gray_qimage(gray).save(filename)
     
     def exit_app(self):
         # Clean shutdown
+        self.pending_request = None
         if self.worker and self.worker.isRunning():
-            self.worker.quit()
+            self.worker.cancel()
             self.worker.wait()
         QApplication.quit()
 
@@ -541,8 +674,9 @@ class FractalApp(QWidget):
         self.showFullScreen()
 
     def closeEvent(self, event):
+        self.fractal_tab.pending_request = None
         if self.fractal_tab.worker and self.fractal_tab.worker.isRunning():
-            self.fractal_tab.worker.quit()
+            self.fractal_tab.worker.cancel()
             self.fractal_tab.worker.wait()
         event.accept()
 
@@ -0,0 +1,342 @@
+"""
+Headless command-line renderer.
+
+    python -m newton_fractal render "z**3 - 1" -o fractal.png --width 4000 --height 4000
+    python -m newton_fractal batch jobs.json --jobs 4
+    python -m newton_fractal worker coordinator-host:6000 --authkey secret
+    python -m newton_fractal animate "z**3 - 1" path.json -o frames/ --fps 30
+
+render and batch accept --listen HOST:PORT to have tiles rendered by
+worker processes that connect to it (see distributed.py), and --cache to
+read repeated renders back from the on-disk render cache (see render_cache.py).
+
+A batch manifest is a JSON list of jobs (or {"jobs": [...]}), each with
+"function" and "output" plus any of the render options below, e.g.
+
+    [{"function": "z**3 - 1", "output": "a.png", "xlim": [-1, 1], "ylim": [-1, 1]}]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from animation import PNGSequenceSink, RawVideoSink, ZoomPath, render_animation
+from distributed import Coordinator, parse_address, run_worker
+from fractal_engine import BACKENDS, KERNELS, PRECISIONS, NewtonFractalEngine
+from image_io import render_png, save_png
+from render_cache import RenderCache, cached_compute
+
+JOB_DEFAULTS = {
+    'width': 1000,
+    'height': 1000,
+    'xlim': (-2, 2),
+    'ylim': (-2, 2),
+    'max_iter': 50,
+    'tol': 1e-6,
+    'backend': 'auto',
+    'kernel': 'vectorized',
+    'workers': None,
+    'tile_size': 'auto',
+    'basins': False,
+    'adaptive': False,
+    'smooth': False,
+    'supersample': 0,
+    'precision': 'auto',
+    'stats': None,
+}
+
+
+def render_job(job, progress_callback=None, coordinator=None, render_cache=None):
+    """
+    Render one job dict (see JOB_DEFAULTS) to job['output'].
+    .png files are streamed band by band; .npy files are written as memory maps.
+    If job['stats'] is set, the render statistics are written there as JSON.
+    With a coordinator, tiles are rendered by its workers. With a
+    RenderCache, the image is read from it if the same render is cached and
+    stored in it otherwise; the whole image is then held in memory.
+    """
+    options = dict(JOB_DEFAULTS, **job)
+    engine = NewtonFractalEngine(
+        func_str=options['function'],
+        width=options['width'],
+        height=options['height'],
+        max_iter=options['max_iter'],
+        tol=options['tol'],
+        backend=options['backend'],
+        kernel=options['kernel'],
+        workers=options['workers'],
+        adaptive=options['adaptive'],
+        smooth=options['smooth'],
+        supersample=options['supersample'],
+        precision=options['precision'],
+        coordinator=coordinator,
+    )
+    engine.xlim = tuple(options['xlim'])
+    engine.ylim = tuple(options['ylim'])
+
+    output = options['output']
+    if render_cache is not None:
+        _render_cached(engine, render_cache, output, options, progress_callback)
+    elif output.endswith('.npy'):
+        if options['basins']:
+            stem = output[:-len('.npy')]
+            _, roots = engine.render_to_memmap(output, options['tile_size'], progress_callback, stem + '_labels.npy')
+            np.save(stem + '_roots.npy', roots)
+        else:
+            engine.render_to_memmap(output, options['tile_size'], progress_callback)
+    else:
+        render_png(engine, output, options['tile_size'], progress_callback, basins=options['basins'])
+    if options['stats']:
+        engine.last_stats.to_json(options['stats'])
+    return output
+
+
+def _render_cached(engine, render_cache, output, options, progress_callback):
+    basins = options['basins']
+    result = cached_compute(engine, render_cache, options['tile_size'], progress_callback, return_labels=basins)
+    iterations, labels, roots = result if basins else (result, None, None)
+    if output.endswith('.npy'):
+        np.save(output, iterations)
+        if basins:
+            # Label k > 0 is roots[k - 1]
+            stem = output[:-len('.npy')]
+            np.save(stem + '_labels.npy', labels)
+            np.save(stem + '_roots.npy', roots)
+    else:
+        save_png(output, iterations, engine.max_iter, labels, roots.size if basins else 0)
+
+
+def load_manifest(path):
+    with open(path) as fh:
+        manifest = json.load(fh)
+    jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+    for index, job in enumerate(jobs):
+        missing = {'function', 'output'} - set(job)
+        if missing:
+            raise ValueError(f"job {index} is missing {', '.join(sorted(missing))}")
+        unknown = set(job) - set(JOB_DEFAULTS) - {'function', 'output'}
+        if unknown:
+            raise ValueError(f"job {index} has unknown options {', '.join(sorted(unknown))}")
+    return jobs
+
+
+def run_batch(jobs, concurrency=1, output_dir=None, coordinator=None, render_cache=None):
+    """
+    Render jobs concurrently. Engines share the process-wide function
+    cache, so jobs with the same f(z) only compile it once. Cores are
+    split evenly between concurrently running jobs. With a RenderCache,
+    jobs rendered before are read back from it.
+    Returns a list of (output, error) pairs in manifest order.
+    """
+    concurrency = max(1, min(concurrency, len(jobs)))
+    workers_per_job = max(1, (os.cpu_count() or 1) // concurrency)
+
+    def run(job):
+        job = dict(job)
+        if output_dir is not None:
+            job['output'] = os.path.join(output_dir, job['output'])
+        job.setdefault('workers', workers_per_job)
+        start = time.perf_counter()
+        try:
+            render_job(job, coordinator=coordinator, render_cache=render_cache)
+        except Exception as exc:
+            print(f"FAILED {job['output']}: {exc}", file=sys.stderr)
+            return job['output'], exc
+        print(f"{job['output']} ({time.perf_counter() - start:.2f}s)")
+        return job['output'], None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(run, jobs))
+
+
+def _tile_size(value):
+    return value if value == 'auto' else int(value)
+
+
+def _add_render_options(parser):
+    parser.add_argument('--width', type=int, default=JOB_DEFAULTS['width'])
+    parser.add_argument('--height', type=int, default=JOB_DEFAULTS['height'])
+    parser.add_argument('--xlim', type=float, nargs=2, default=JOB_DEFAULTS['xlim'], metavar=('X0', 'X1'))
+    parser.add_argument('--ylim', type=float, nargs=2, default=JOB_DEFAULTS['ylim'], metavar=('Y0', 'Y1'))
+    parser.add_argument('--max-iter', type=int, default=JOB_DEFAULTS['max_iter'])
+    parser.add_argument('--tol', type=float, default=JOB_DEFAULTS['tol'])
+    parser.add_argument('--backend', choices=BACKENDS, default=JOB_DEFAULTS['backend'])
+    parser.add_argument('--kernel', choices=KERNELS, default=JOB_DEFAULTS['kernel'])
+    parser.add_argument('--precision', choices=PRECISIONS, default=JOB_DEFAULTS['precision'])
+    parser.add_argument('--workers', type=int, default=JOB_DEFAULTS['workers'])
+    parser.add_argument('--tile-size', type=_tile_size, default=JOB_DEFAULTS['tile_size'],
+                        help="tile side in pixels, or 'auto' (default) to size tiles for this machine")
+    parser.add_argument('--basins', action='store_true', help="color by root instead of iteration count")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="skip the interior of regions whose border converges uniformly")
+    parser.add_argument('--smooth', action='store_true',
+                        help="fractional iteration counts, for shading without bands (.npy output is float32)")
+    parser.add_argument('--supersample', type=int, default=JOB_DEFAULTS['supersample'], metavar='N',
+                        help="anti-alias the iteration shading of basin boundaries with N extra jittered samples "
+                             "per boundary pixel (--basins hues stay one sample per pixel)")
+    parser.add_argument('--stats', metavar='FILE', help="write per-render timing and iteration statistics as JSON")
+
+
+def _add_distributed_options(parser):
+    parser.add_argument('--listen', metavar='HOST:PORT',
+                        help="render tiles on worker processes that connect to this address")
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help="with --listen, also start this many workers on this machine")
+    _add_authkey_option(parser)
+
+
+def _add_cache_options(parser):
+    parser.add_argument('--cache', action='store_true',
+                        help="reuse identical renders from the on-disk render cache, and store new ones")
+    parser.add_argument('--cache-dir', help="render cache directory (default: renders/ under $NEWTON_FRACTAL_CACHE_DIR)")
+    parser.add_argument('--cache-size', type=float, default=1024, metavar='MB',
+                        help="evict least recently used renders beyond this size (default: 1024)")
+
+
+def _render_cache(args):
+    if not args.cache:
+        return None
+    return RenderCache(args.cache_dir, int(args.cache_size * 1024 * 1024))
+
+
+def _add_authkey_option(parser):
+    parser.add_argument('--authkey', default=os.environ.get('NEWTON_FRACTAL_AUTHKEY'),
+                        help="shared secret between coordinator and workers (default: $NEWTON_FRACTAL_AUTHKEY; "
+                             "the coordinator generates and prints one if neither is set)")
+
+
+def _start_coordinator(args):
+    if not args.listen:
+        return None
+    coordinator = Coordinator(parse_address(args.listen, default_host=''),
+                              args.authkey.encode() if args.authkey else None)
+    coordinator.start_local_workers(args.local_workers)
+    print(f"listening on {coordinator.address[0]}:{coordinator.address[1]}", file=sys.stderr)
+    if not args.authkey:
+        print(f"authkey {coordinator.authkey.decode()}", file=sys.stderr)
+    return coordinator
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='newton_fractal', description="Headless Newton fractal renderer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    render = commands.add_parser('render', help="render a single image")
+    render.add_argument('function', help="f(z), e.g. 'z**3 - 1'")
+    render.add_argument('-o', '--output', default='fractal.png', help=".png image or .npy iteration counts "
+                        "(with --basins also <stem>_labels.npy and <stem>_roots.npy)")
+    _add_render_options(render)
+    _add_distributed_options(render)
+    _add_cache_options(render)
+
+    batch = commands.add_parser('batch', help="render the jobs listed in a JSON manifest")
+    batch.add_argument('manifest')
+    batch.add_argument('--jobs', type=int, default=1, help="number of jobs rendered concurrently")
+    batch.add_argument('--output-dir', help="directory that job outputs are relative to")
+    _add_distributed_options(batch)
+    _add_cache_options(batch)
+
+    animate = commands.add_parser('animate', help="render a zoom animation along a keyframe path")
+    animate.add_argument('function', help="f(z), e.g. 'z**3 - 1'")
+    animate.add_argument('path', help='JSON list of {"time": t, "center": [x, y], "scale": half_width}')
+    output = animate.add_mutually_exclusive_group(required=True)
+    output.add_argument('-o', '--output-dir', help="write frames as numbered PNG files here")
+    output.add_argument('--raw', metavar='FILE', help="write raw RGB24 frames to FILE ('-' for stdout)")
+    animate.add_argument('--width', type=int, default=1280)
+    animate.add_argument('--height', type=int, default=720)
+    animate.add_argument('--fps', type=float, default=30)
+    animate.add_argument('--oversample', type=int, default=2,
+                         help="anchor images are this many times larger than frames; 1 renders every frame exactly")
+    animate.add_argument('--max-iter', type=int, default=JOB_DEFAULTS['max_iter'])
+    animate.add_argument('--tol', type=float, default=JOB_DEFAULTS['tol'])
+    animate.add_argument('--backend', choices=BACKENDS, default=JOB_DEFAULTS['backend'])
+    animate.add_argument('--kernel', choices=KERNELS, default=JOB_DEFAULTS['kernel'])
+    animate.add_argument('--precision', choices=PRECISIONS, default=JOB_DEFAULTS['precision'])
+    animate.add_argument('--workers', type=int, default=JOB_DEFAULTS['workers'])
+    animate.add_argument('--tile-size', type=_tile_size, default=JOB_DEFAULTS['tile_size'])
+    animate.add_argument('--basins', action='store_true', help="color by root instead of iteration count")
+    animate.add_argument('--smooth', action='store_true', help="fractional iteration counts, for shading without bands")
+    animate.add_argument('--supersample', type=int, default=JOB_DEFAULTS['supersample'], metavar='N',
+                         help="anti-alias the iteration shading of basin boundaries with N extra jittered "
+                              "samples per boundary pixel (--basins hues stay one sample per pixel)")
+
+    worker = commands.add_parser('worker', help="render tiles for a coordinator started with --listen")
+    worker.add_argument('address', metavar='HOST:PORT')
+    worker.add_argument('--processes', type=int, default=1, help="worker processes to run on this machine")
+    worker.add_argument('--backend', choices=BACKENDS, default='auto')
+    _add_authkey_option(worker)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        if not args.authkey:
+            parser.error("worker needs --authkey or $NEWTON_FRACTAL_AUTHKEY (printed by the coordinator)")
+        address, authkey = parse_address(args.address), args.authkey.encode()
+        if args.processes <= 1:
+            run_worker(address, authkey, args.backend)
+            return 0
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=run_worker, args=(address, authkey, args.backend))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return 0
+
+    if args.command == 'animate':
+        with open(args.path) as fh:
+            path = ZoomPath.from_json(json.load(fh))
+        if args.output_dir:
+            sink = PNGSequenceSink(args.output_dir)
+        elif args.raw == '-':
+            sink = RawVideoSink(sys.stdout.buffer)
+        else:
+            sink = RawVideoSink(open(args.raw, 'wb'))
+
+        def progress_callback(percent):
+            print(f"\r{percent:3d}%", end='', file=sys.stderr, flush=True)
+
+        frames = render_animation(args.function, path, sink, args.width, args.height, args.fps,
+                                  args.oversample, args.basins, args.tile_size, progress_callback,
+                                  max_iter=args.max_iter, tol=args.tol, backend=args.backend,
+                                  kernel=args.kernel, precision=args.precision, workers=args.workers,
+                                  smooth=args.smooth, supersample=args.supersample)
+        if args.raw and args.raw != '-':
+            sink.fh.close()
+        print(f"\n{frames} frames", file=sys.stderr)
+        return 0
+
+    coordinator = _start_coordinator(args)
+    try:
+        if args.command == 'render':
+            job = {key: getattr(args, key) for key in JOB_DEFAULTS}
+            job.update(function=args.function, output=args.output)
+
+            def progress_callback(percent):
+                print(f"\r{percent:3d}%", end='', file=sys.stderr, flush=True)
+
+            render_job(job, progress_callback, coordinator, _render_cache(args))
+            print(file=sys.stderr)
+            print(args.output)
+            return 0
+
+        results = run_batch(load_manifest(args.manifest), args.jobs, args.output_dir, coordinator,
+                            _render_cache(args))
+        return 1 if any(error is not None for _, error in results) else 0
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
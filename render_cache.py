@@ -0,0 +1,164 @@
+"""
+Persistent cache of whole renders, so repeated jobs (the same function,
+view, size and settings) are read back from disk instead of recomputed.
+
+    cache = RenderCache()
+    image, labels, roots = cached_compute(engine, cache, return_labels=True)
+
+Entries are content-addressed: the file name is a SHA-256 of everything
+that determines the output plus ENGINE_VERSION, so changed settings or a
+changed engine never return stale pixels. Each entry is one compressed
+.npz file; the directory is kept under max_bytes by deleting the least
+recently used entries (hits refresh a file's mtime).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from function_cache import default_cache_dir, normalize_expression
+from render_stats import RenderStats
+
+# Bump whenever an engine change alters the pixels it produces
+ENGINE_VERSION = 1
+
+
+class RenderCache:
+    """
+    Directory of compressed render results bounded by total bytes.
+    Safe to share between threads and processes: entries are written to a
+    temporary file and renamed into place.
+    """
+    def __init__(self, cache_dir=None, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'renders')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, engine, labels=False, tile_size='auto'):
+        """Hex digest of every engine parameter that affects the output."""
+        params = {
+            'engine_version': ENGINE_VERSION,
+            'function': normalize_expression(engine.func_str),
+            'width': engine.width,
+            'height': engine.height,
+            # str() of a long double keeps all of its digits for deep zooms
+            'xlim': [str(np.longdouble(v)) for v in engine.xlim],
+            'ylim': [str(np.longdouble(v)) for v in engine.ylim],
+            'max_iter': engine.max_iter,
+            'tol': engine.tol,
+            'root_tol': engine.root_tol,
+            'backend': engine.backend,
+            'kernel': engine.kernel,
+            'precision': engine.resolve_precision(),
+            'adaptive': engine.adaptive,
+            'smooth': engine.smooth,
+            'supersample': engine.supersample,
+            'labels': labels,
+        }
+        if engine.adaptive:
+            # Subdivision starts from tile borders, so the tiling changes the pixels
+            params['adaptive_min_size'] = engine.adaptive_min_size
+            params['adaptive_tolerance'] = engine.adaptive_tolerance
+            params['tile_size'] = engine.resolve_tile_size(tile_size, labels)
+        text = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """(iterations, labels, roots) for key, or None. labels and roots may be None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = (data['iterations'],
+                         data['labels'] if 'labels' in data else None,
+                         data['roots'] if 'roots' in data else None)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, iterations, labels=None, roots=None):
+        arrays = {'iterations': iterations}
+        if labels is not None:
+            arrays['labels'] = labels
+            arrays['roots'] = roots
+        if sum(a.nbytes for a in arrays.values() if a is not None) > self.max_bytes:
+            return  # Would only be evicted again, taking every other entry with it
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as fh:
+                np.savez_compressed(fh, **arrays)
+            os.replace(tmp_path, path)
+            self._evict()
+        except OSError:
+            pass # The disk cache is best effort
+
+    def _evict(self):
+        """Delete least recently used entries until the directory fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass # Already evicted by another process
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+def cached_compute(engine, cache, tile_size='auto', progress_callback=None, return_labels=False):
+    """
+    engine.compute(tile_size, progress_callback, return_labels), read from
+    cache when the same render was stored before and stored otherwise.
+    On a hit engine.last_stats records a single cached tile.
+    """
+    start = time.perf_counter()
+    key = cache.key(engine, return_labels, tile_size)
+    entry = cache.get(key)
+    if entry is not None:
+        stats = RenderStats(engine, 'cached')
+        stats.add_tile(0, 0, engine.height, engine.width, time.perf_counter() - start, cached=True)
+        stats.finish()
+        engine.last_stats = stats
+        if progress_callback:
+            progress_callback(100)
+        iterations, labels, roots = entry
+        return (iterations, labels, roots) if return_labels else iterations
+
+    result = engine.compute(tile_size, progress_callback, return_labels)
+    if return_labels:
+        cache.put(key, *result)
+    else:
+        cache.put(key, result)
+    return result
@@ -0,0 +1,110 @@
+"""
+Per-render instrumentation collected by NewtonFractalEngine.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class RenderStats:
+    """
+    Timings and work counters for one render, safe to update from the tile
+    worker threads. Available as engine.last_stats during and after a render.
+    """
+    def __init__(self, engine, mode):
+        self.mode = mode
+        self.backend = engine.backend
+        self.kernel = engine.kernel
+        self.precision = engine.resolve_precision()
+        self.width = engine.width
+        self.height = engine.height
+        self.max_iter = engine.max_iter
+        self.compile_seconds = engine.compile_seconds
+        self.tiles = []
+        self.bytes_allocated = 0
+        self.bytes_transferred = 0
+        self.transfer_seconds = 0.0
+        self.wall_seconds = None
+        # iteration_histogram[n] = number of iterated points that stopped after n steps
+        self.iteration_histogram = np.zeros(engine.max_iter + 1, dtype=np.int64)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_tile(self, y_start, x_start, height, width, seconds, cached=False):
+        with self._lock:
+            self.tiles.append({'y': y_start, 'x': x_start, 'height': height, 'width': width,
+                               'seconds': seconds, 'cached': cached})
+
+    def add_iterations(self, histogram):
+        with self._lock:
+            self.iteration_histogram += histogram
+
+    def add_allocation(self, nbytes):
+        with self._lock:
+            self.bytes_allocated += int(nbytes)
+
+    def add_transfer(self, nbytes, seconds):
+        with self._lock:
+            self.bytes_transferred += int(nbytes)
+            self.transfer_seconds += seconds
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self._start
+
+    @property
+    def points_iterated(self):
+        return int(self.iteration_histogram.sum())
+
+    @property
+    def active_per_iteration(self):
+        """
+        Number of points still being iterated at each Newton step.
+        """
+        return self.iteration_histogram[::-1].cumsum()[::-1][:self.max_iter]
+
+    @property
+    def newton_steps(self):
+        return int(self.active_per_iteration.sum())
+
+    @property
+    def max_iter_points(self):
+        return int(self.iteration_histogram[self.max_iter])
+
+    def to_dict(self):
+        tile_seconds = [tile['seconds'] for tile in self.tiles]
+        wall = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self._start
+        return {
+            'mode': self.mode,
+            'backend': self.backend,
+            'kernel': self.kernel,
+            'precision': self.precision,
+            'width': self.width,
+            'height': self.height,
+            'max_iter': self.max_iter,
+            'compile_seconds': self.compile_seconds,
+            'wall_seconds': wall,
+            'points_iterated': self.points_iterated,
+            'newton_steps': self.newton_steps,
+            'max_iter_points': self.max_iter_points,
+            'active_per_iteration': self.active_per_iteration.tolist(),
+            'bytes_allocated': self.bytes_allocated,
+            'bytes_transferred': self.bytes_transferred,
+            'transfer_seconds': self.transfer_seconds,
+            'tiles_total': len(self.tiles),
+            'tiles_cached': sum(tile['cached'] for tile in self.tiles),
+            'tile_seconds_max': max(tile_seconds, default=0.0),
+            'tile_seconds_mean': sum(tile_seconds) / len(tile_seconds) if tile_seconds else 0.0,
+            'tiles': self.tiles,
+        }
+
+    def to_json(self, path=None, indent=2):
+        """
+        Serialize to_dict() as JSON; written to path if given, returned otherwise.
+        """
+        text = json.dumps(self.to_dict(), indent=indent)
+        if path is None:
+            return text
+        with open(path, 'w') as fh:
+            fh.write(text)
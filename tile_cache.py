@@ -0,0 +1,71 @@
+"""
+In-memory cache of rendered tiles, so revisiting a viewport (e.g. resetting
+the zoom) only computes the tiles that are missing.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TileCache:
+    """
+    Thread-safe LRU of tile results bounded by total bytes.
+    Keys are built by NewtonFractalEngine from the expression, the tile's
+    world coordinates, pixel scale, shape, max_iter and tol. Values are
+    (iterations, labels, roots) host arrays; labels index into roots
+    (1-based, 0 = not converged) and are None if the tile was rendered
+    without root labels.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, need_labels=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (need_labels and entry[1] is None):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, iterations, labels=None, roots=None):
+        entry = (iterations, labels, roots)
+        size = sum(a.nbytes for a in entry if a is not None)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= sum(a.nbytes for a in old if a is not None)
+            self._entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= sum(a.nbytes for a in evicted if a is not None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def compact_labels(labels, roots):
+    """
+    Re-index a tile's labels against only the roots it uses.
+    Returns (local labels, local roots) suitable for TileCache.put.
+    """
+    used = np.unique(labels)
+    used = used[used > 0]
+    remap = np.zeros(roots.size + 1, dtype=np.uint16)
+    remap[used] = np.arange(1, used.size + 1, dtype=np.uint16)
+    return remap[labels], roots[used - 1]
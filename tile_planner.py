@@ -0,0 +1,227 @@
+"""
+Automatic tile sizing for NewtonFractalEngine (tile_size='auto').
+
+The tile side is chosen from:
+- a calibration sweep, run once per machine, backend, kernel and
+  precision: small tiles pay a fixed per-tile cost, large ones fall out
+  of CPU caches, so only sides whose cost per pixel is close to the best
+  measured one are used;
+- parallelism: each worker should get several tiles, so cores stay busy
+  near the end of a render and progress and cancellation stay responsive;
+- memory: the tiles the scheduler keeps in flight must fit in a share of
+  free RAM or device memory.
+Adaptive renders are the exception: their pixels depend on the tiling,
+so they use a fixed ADAPTIVE_TILE_SIZE side.
+"""
+import json
+import math
+import os
+import platform
+import time
+
+import numpy as np
+
+from function_cache import default_cache_dir
+
+# Share of free memory the tiles in flight may use
+MEMORY_FRACTION = 0.25
+# Tile sides costing at most this much more per pixel than the best are efficient
+EFFICIENCY_SLACK = 0.1
+# Tiles per worker, for load balancing
+TILES_PER_WORKER = 4
+MIN_TILE_SIZE = 32
+CALIBRATION_SIZES = (32, 64, 128, 256, 512)
+CALIBRATION_VERSION = 1
+# Side for adaptive renders, which must not change with free memory
+ADAPTIVE_TILE_SIZE = 256
+
+
+class TilePlan:
+    """
+    The tile size chosen for a render and the figures it was derived from.
+    """
+    def __init__(self, tile_size, width, height, workers, bytes_per_pixel, memory_available,
+                 pixel_seconds, efficient_sides, limited_by):
+        self.tile_size = tile_size
+        self.width = width
+        self.height = height
+        self.workers = workers
+        self.bytes_per_pixel = bytes_per_pixel
+        self.memory_available = memory_available
+        # Calibrated cost per pixel at the most efficient side
+        self.pixel_seconds = pixel_seconds
+        # (smallest, largest) efficient side; largest is None if cost kept falling
+        self.efficient_sides = efficient_sides
+        # 'calibration', 'parallelism', 'memory', 'image' or 'adaptive'
+        self.limited_by = limited_by
+
+    @property
+    def tiles(self):
+        return -(-self.height // self.tile_size) * -(-self.width // self.tile_size)
+
+    @property
+    def bytes_per_tile(self):
+        return self.tile_size * self.tile_size * self.bytes_per_pixel
+
+    @property
+    def estimated_seconds(self):
+        """Rough render time for z**3 - 1; other functions scale with their cost."""
+        return self.width * self.height * self.pixel_seconds / self.workers
+
+    def to_dict(self):
+        return {
+            'tile_size': self.tile_size,
+            'tiles': self.tiles,
+            'workers': self.workers,
+            'bytes_per_tile': self.bytes_per_tile,
+            'bytes_per_pixel': self.bytes_per_pixel,
+            'memory_available': self.memory_available,
+            'pixel_seconds': self.pixel_seconds,
+            'efficient_sides': list(self.efficient_sides),
+            'estimated_seconds': self.estimated_seconds,
+            'limited_by': self.limited_by,
+        }
+
+    def __repr__(self):
+        return (f"TilePlan(tile_size={self.tile_size}, tiles={self.tiles}, "
+                f"workers={self.workers}, limited_by={self.limited_by!r})")
+
+
+def available_memory(backend='numpy'):
+    """Free device memory for CuPy, otherwise available host RAM, in bytes."""
+    if backend == 'cupy':
+        import cupy
+        free, _ = cupy.cuda.runtime.memGetInfo()
+        # Blocks cached by CuPy's memory pool are free to reuse
+        return free + cupy.get_default_memory_pool().free_bytes()
+    try:
+        with open('/proc/meminfo') as fh:
+            for line in fh:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 2 * 1024 ** 3
+
+
+def bytes_per_pixel(complex_itemsize, labels=True):
+    """
+    Peak working memory per tile pixel: the grid, the iterate, f and f'
+    and the Newton step (complex), the float32 counts and host copy, the
+    active-set index and masks, and the uint16 labels.
+    """
+    return 5 * complex_itemsize + 2 * 4 + 8 + 2 + (2 if labels else 0)
+
+
+def _calibration_path():
+    return os.path.join(default_cache_dir(), 'tile_calibration.json')
+
+
+def _calibration_key(engine):
+    return '|'.join((platform.node(), str(os.cpu_count()), engine.backend, engine.kernel,
+                     engine.resolve_precision(), str(CALIBRATION_VERSION)))
+
+
+def _measure(engine):
+    """
+    Seconds per pixel of square z**3 - 1 tiles of each CALIBRATION_SIZES
+    side, rendered with the engine's backend, kernel and precision.
+    """
+    reference = type(engine)('z**3 - 1', max_iter=engine.max_iter, tol=engine.tol,
+                             backend=engine.backend, kernel=engine.kernel,
+                             precision=engine.resolve_precision(), workers=1)
+    costs = {}
+    for size in CALIBRATION_SIZES:
+        reference.width = reference.height = size
+        x_coords, y_coords = reference._axes()
+        reference._compute_tile(x_coords, y_coords)  # warm-up (JIT, memory pool)
+        best = math.inf
+        for _ in range(3):
+            start = time.perf_counter()
+            reference._compute_tile(x_coords, y_coords)
+            if reference.backend == 'cupy':
+                import cupy
+                cupy.cuda.Stream.null.synchronize()
+            best = min(best, time.perf_counter() - start)
+        costs[size] = best / (size * size)
+    return costs
+
+
+def calibrate(engine, refresh=False):
+    """
+    Cost per pixel by tile side on this machine for the engine's backend,
+    kernel and precision, as {side: seconds}. Measured once and cached
+    as JSON in the cache directory.
+    """
+    path = _calibration_path()
+    key = _calibration_key(engine)
+    try:
+        with open(path) as fh:
+            table = json.load(fh)
+    except (OSError, ValueError):
+        table = {}
+    if refresh or key not in table:
+        table[key] = _measure(engine)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as fh:
+                json.dump(table, fh, indent=2)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # Calibration is cheap to redo; a read-only cache is not an error
+    return {int(size): cost for size, cost in table[key].items()}
+
+
+def _round_down(size):
+    """Round to a power of two so the tile grid, and tile cache keys, stay stable."""
+    return 1 << int(math.log2(size))
+
+
+def plan_tiles(engine, labels=True):
+    """
+    Choose a square tile size for rendering engine's current image.
+    Returns a TilePlan.
+    """
+    H, W = engine.height, engine.width
+    image_side = max(H, W)
+    # Tiles in flight: the scheduler keeps up to two per worker queued
+    in_flight = 2 * engine.workers if engine.backend == 'numpy' else 1
+    real_dtype = engine._axes()[0].dtype
+    per_pixel = bytes_per_pixel(2 * np.dtype(real_dtype).itemsize, labels)
+    memory = available_memory(engine.backend)
+
+    costs = calibrate(engine)
+    pixel_seconds = min(costs.values())
+    efficient = sorted(size for size, cost in costs.items()
+                       if cost <= pixel_seconds * (1 + EFFICIENCY_SLACK))
+    smallest = efficient[0]
+    # Still efficient at the largest calibrated side: larger tiles are fine too
+    largest = None if efficient[-1] == max(costs) else efficient[-1]
+
+    if engine.backend == 'numpy':
+        side, limited_by = math.sqrt(H * W / (TILES_PER_WORKER * engine.workers)), 'parallelism'
+    else:
+        # One device stream: larger tiles only help
+        side, limited_by = math.inf, 'calibration'
+    if side < smallest:
+        side, limited_by = smallest, 'calibration'
+    if largest is not None and side > largest:
+        side, limited_by = largest, 'calibration'
+    memory_side = math.sqrt(memory * MEMORY_FRACTION / (per_pixel * in_flight))
+    if memory_side < side:
+        side, limited_by = memory_side, 'memory'
+
+    if engine.adaptive:
+        # Subdivision starts from tile borders, so a side following free memory
+        # would change the pixels (and render cache keys) from one run to the next
+        tile_size, limited_by = min(image_side, ADAPTIVE_TILE_SIZE), 'adaptive'
+    elif side >= image_side:
+        tile_size, limited_by = image_side, 'image'
+    else:
+        tile_size = min(image_side, max(MIN_TILE_SIZE, _round_down(side)))
+    return TilePlan(tile_size, W, H, engine.workers, per_pixel, memory,
+                    pixel_seconds, (smallest, largest), limited_by)